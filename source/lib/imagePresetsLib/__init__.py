@@ -1,15 +1,41 @@
+import hashlib
+import itertools
+import os
+import threading
+import uuid
 from typing import Iterable
 
 import AppKit
 import install  # to register custom subscriber events
-from mojo.events import postEvent
-from mojo.extensions import ExtensionBundle, getExtensionDefault, setExtensionDefault
+from mojo.extensions import getExtensionDefault, setExtensionDefault
 from mojo.tools import CallbackWrapper
-from Quartz import CIFilter
+
+from .filterGraph import optimizeFilterDicts, verifyOptimizedFilterDicts
+from .linking import (
+    LinkedPresetsIndex,
+    linkAppliedPresetsDefaultKey,
+    linkedPresetsIndex,
+)
+from .nameIndex import PresetNameIndex
+from .thumbnails import PresetThumbnailRenderer, thumbnailRenderer
+from .tracing import eventTracer, postTracedEvent
 
 _LIB_KEY = lambda s: f"com.adbac.ImagePresets.{s}"
 
 
+def _postEvent(eventName, **kwargs):
+    # Subscriber events are registered with prefixed low-level event names
+    postTracedEvent(eventName, _LIB_KEY(eventName), **kwargs)
+
+
+# Shared by all presets so that (name, version) pairs are never reused
+_presetVersions = itertools.count(1)
+
+# Held while presets and the manager's preset list are written, so that
+# snapshots never see a half-applied change
+_presetsLock = threading.RLock()
+
+
 def normalizeValue(value, sourceRange, targetRange):
     """
     Normalize a value from the current range to the target range.
@@ -132,6 +158,98 @@ class RGBAColor:
         return cls(self.red, self.green, self.blue, self.alpha)
 
 
+class ImagePresetSnapshot:
+    """
+    An immutable view of an image preset at a given version, holding its
+    values converted to filter space
+    """
+
+    __slots__ = (
+        "name",
+        "version",
+        "brightness",
+        "contrast",
+        "saturation",
+        "sharpness",
+        "color",
+        "opacity",
+        "merzFilterDicts",
+        "hash",
+        "contentHash",
+    )
+
+    # Filter values are compared to this precision by the content hash
+    _contentHashPrecision = 10_000
+
+    def __init__(self, preset, version):
+        color = preset._convertUserValueToFilterValue(
+            "color", ignoreColorOpacity=False
+        )
+        values = dict(
+            name=preset.name,
+            version=version,
+            brightness=preset._convertUserValueToFilterValue("brightness"),
+            contrast=preset._convertUserValueToFilterValue("contrast"),
+            saturation=preset._convertUserValueToFilterValue("saturation"),
+            sharpness=preset._convertUserValueToFilterValue("sharpness"),
+            color=tuple(color) if color is not None else None,
+            opacity=color.alpha if color is not None else 1,
+            merzFilterDicts=tuple(
+                {
+                    key: tuple(value) if isinstance(value, RGBAColor) else value
+                    for key, value in fd.items()
+                }
+                for fd in preset.asMerzFilterDicts(useSnapshot=False)
+            ),
+        )
+        values["hash"] = hashlib.sha1(
+            repr(tuple(values[attr] for attr in ImagePreset._attrs)).encode("utf-8")
+        ).hexdigest()
+        values["contentHash"] = self._makeContentHash(values)
+        for attr, value in values.items():
+            object.__setattr__(self, attr, value)
+
+    @classmethod
+    def _makeContentHash(cls, values):
+        # Quantize the filter values to integers, so that float noise and
+        # signed zeros don't change the hash
+        def quantize(value):
+            return round(value * cls._contentHashPrecision)
+
+        content = [
+            quantize(values[attr])
+            for attr in ("brightness", "contrast", "saturation", "sharpness")
+        ]
+        color = values["color"]
+        content.append(None if color is None else tuple(quantize(c) for c in color))
+        return hashlib.sha1(repr(content).encode("utf-8")).hexdigest()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, ImagePresetSnapshot):
+            return NotImplemented
+        return (self.name, self.version) == (other.name, other.version)
+
+    def __hash__(self):
+        return hash((self.name, self.version))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r}, version={self.version})"
+
+    @property
+    def key(self):
+        """
+        The (name, version) pair identifying this state of the preset, to be
+        used as a cache key.
+        """
+        return (self.name, self.version)
+
+
 class ImagePreset:
     """
     An object storing the data of an image preset
@@ -198,7 +316,10 @@ class ImagePreset:
         saveToDefaults=False,
     ):
         self._holdEvents = True
+        self._holdSaves = False
         self._addedToManager = False
+        self._version = next(_presetVersions)
+        self._snapshot = None
 
         # Initialize private attributes to avoid AttributeError
         self._name = None
@@ -259,23 +380,88 @@ class ImagePreset:
     def _setFilterValueByName(self, name: str, value):
         r = self.filterDefaults[name]
         attr = f"_{name}"
-        oldDict = self.asDict()
-        if value is None:
-            setattr(self, attr, r.default)
-        else:
+        if value is not None:
             assert r.min <= value <= r.max, (
                 f"{name.capitalize()} value must be comprised between {r.min} and {r.max}"
             )
+        value = r.default if value is None else value
+        with _presetsLock:
+            # Writing the same value back isn't a change
+            if getattr(self, attr) == value:
+                return
+            oldDict = self.asDict()
             setattr(self, attr, value)
-        self._saveDefaultsIfAddedToManager()
+            self._bumpVersion()
+            newDict = self.asDict()
+        self._didChange(oldDict, newDict)
+
+    def _bumpVersion(self):
+        self._version = next(_presetVersions)
+        self._snapshot = None
+
+    def _didChange(self, oldDict, newDict, save=True):
+        if save:
+            self._saveDefaultsIfAddedToManager()
         if not self._holdEvents:
-            postEvent(
+            _postEvent(
                 "imagePresetsManagerPresetChanged",
                 old=oldDict,
-                new=self.asDict(),
+                new=newDict,
                 preset=self,
             )
 
+    @property
+    def version(self):
+        """
+        A number increasing every time the preset changes.
+        """
+        return self._version
+
+    def snapshot(self):
+        """
+        Return an immutable `ImagePresetSnapshot` of the current state of the
+        preset, built once per version.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self._version:
+            with _presetsLock:
+                snapshot = ImagePresetSnapshot(self, self._version)
+                self._snapshot = snapshot
+        return snapshot
+
+    @property
+    def contentHash(self):
+        """
+        A hash of the filter values of the preset, ignoring its name, stable
+        across sessions. Presets rendering the same way share the same hash.
+        """
+        return self.snapshot().contentHash
+
+    def update(self, values: dict, saveToDefaults=True):
+        """
+        Set several values at once, posting a single change event.
+        Args:
+            values (dict): The new values by attribute name, as returned by `asDict`.
+            saveToDefaults (bool): Save the presets if the preset is registered.
+        Returns:
+            True if the preset changed.
+        """
+        with _presetsLock:
+            oldDict = self.asDict()
+            holdEvents, holdSaves = self._holdEvents, self._holdSaves
+            self._holdEvents = self._holdSaves = True
+            try:
+                for attr in self._attrs:
+                    if attr in values:
+                        setattr(self, attr, values[attr])
+            finally:
+                self._holdEvents, self._holdSaves = holdEvents, holdSaves
+            newDict = self.asDict()
+        if newDict == oldDict:
+            return False
+        self._didChange(oldDict, newDict, save=saveToDefaults)
+        return True
+
     @property
     def name(self):
         return self._name
@@ -283,16 +469,16 @@ class ImagePreset:
     @name.setter
     def name(self, value):
         assert isinstance(value, str), "Name must be a string"
-        oldDict = self.asDict()
-        self._name = value
-        self._saveDefaultsIfAddedToManager()
-        if not self._holdEvents:
-            postEvent(
-                "imagePresetsManagerPresetChanged",
-                old=oldDict,
-                new=self.asDict(),
-                preset=self,
-            )
+        with _presetsLock:
+            if value == self._name:
+                return
+            oldDict = self.asDict()
+            self._name = value
+            self._bumpVersion()
+            newDict = self.asDict()
+            if self._addedToManager:
+                ImagePresetsManager._publishPresets(ImagePresetsManager.presets)
+        self._didChange(oldDict, newDict)
 
     @property
     def brightness(self):
@@ -332,13 +518,10 @@ class ImagePreset:
 
     @color.setter
     def color(self, value):
-        oldDict = self.asDict()
         colorRange = self.filterDefaults["color"]
         rgbRange = colorRange.rgbRange
         alphaRange = colorRange.alphaRange
-        if isinstance(value, RGBAColor) or value is None:
-            self._color = value
-        else:
+        if not (isinstance(value, RGBAColor) or value is None):
             assert isinstance(value, Iterable) and len(value) == 4, (
                 "Color must be an RGBA iterable"
             )
@@ -348,15 +531,18 @@ class ImagePreset:
             ), (
                 f"RGB values must be comprised between {rgbRange.min} and {rgbRange.max}, and alpha value between {alphaRange.min} and {alphaRange.max}"
             )
-            self._color = RGBAColor(*value)
-        self._saveDefaultsIfAddedToManager()
-        if not self._holdEvents:
-            postEvent(
-                "imagePresetsManagerPresetChanged",
-                old=oldDict,
-                new=self.asDict(),
-                preset=self,
-            )
+            value = RGBAColor(*value)
+        with _presetsLock:
+            oldColor = self._color
+            if (oldColor is None or value is None) and oldColor is value:
+                return
+            if None not in (oldColor, value) and tuple(oldColor) == tuple(value):
+                return
+            oldDict = self.asDict()
+            self._color = value
+            self._bumpVersion()
+            newDict = self.asDict()
+        self._didChange(oldDict, newDict)
 
     @classmethod
     def fromDict(cls, sourceDict: dict):
@@ -394,6 +580,38 @@ class ImagePreset:
         )
         return preset
 
+    @classmethod
+    def fromImageStatistics(cls, image, name: str, **kwargs):
+        """
+        Make a preset normalizing the brightness, contrast and saturation of
+        an image, from the histogram of its luminance.
+        Args:
+            image: A glyph image, or encoded image data.
+            name (str): The name of the preset.
+            **kwargs: Passed to `imageStatistics.presetValuesFromImageData`.
+        """
+        # NumPy is only imported when needed
+        from .imageStatistics import presetValuesFromImageData
+
+        data = getattr(image, "data", image)
+        values = presetValuesFromImageData(data, cls.filterDefaults, **kwargs)
+        return cls(name=name, **values)
+
+    @classmethod
+    def fromImageFolderStatistics(cls, folderPath, maxWorkers=None, **kwargs):
+        """
+        Make a preset for each image of a folder, named after the image files,
+        analyzing the images in parallel (see `fromImageStatistics`).
+        """
+        from .imageStatistics import presetValuesFromImageFolder
+
+        return [
+            cls(name=os.path.splitext(fileName)[0], **values)
+            for fileName, values in presetValuesFromImageFolder(
+                folderPath, cls.filterDefaults, maxWorkers=maxWorkers, **kwargs
+            )
+        ]
+
     def asDict(self, includeName=True) -> dict:
         d = {}
         for attr in self._filterAttrs:
@@ -441,7 +659,19 @@ class ImagePreset:
         else:
             return filterValue * self._filterConversionDivisionDict[filterName]
 
-    def asMerzFilterDicts(self):
+    def asMerzFilterDicts(self, optimize=True, verify=False, useSnapshot=True):
+        """
+        Return the Merz filter dicts applying the preset.
+        Args:
+            optimize (bool): Drop the filters that leave the image untouched,
+                merge and reorder the others (see `filterGraph.optimizeFilterDicts`).
+            verify (bool): Check that the optimized filters render the same
+                image as the unoptimized ones.
+            useSnapshot (bool): Copy the optimized filters precomputed by the
+                preset snapshot instead of building them again.
+        """
+        if optimize and not verify and useSnapshot:
+            return [dict(fd) for fd in self.snapshot().merzFilterDicts]
         filters = [
             dict(
                 name="colorControls",
@@ -466,36 +696,81 @@ class ImagePreset:
                     color1=(1, 1, 1, 1),
                 )
             )
+        if verify:
+            verifyOptimizedFilterDicts(filters)
+        if optimize:
+            filters = optimizeFilterDicts(filters)
         return filters
 
     def applyToMerzLayer(self, layer, overwriteFilters=False):
         if hasattr(layer, "clearFilters") and hasattr(layer, "appendFilter"):
             if overwriteFilters:
                 layer.setFilters([])
-            filterDicts = self.asMerzFilterDicts()
-            for fd in filterDicts:
-                layer.appendFilter(fd)
+            snapshot = self.snapshot()
+            for fd in snapshot.merzFilterDicts:
+                layer.appendFilter(dict(fd))
             if hasattr(layer, "setOpacity"):
-                if self.color is not None:
-                    layer.setOpacity(self.color.normalized().alpha)
-                else:
-                    layer.setOpacity(1)
-
-    def applyToImage(self, image):
+                layer.setOpacity(snapshot.opacity)
+
+    def applyToImage(self, image, link=None):
+        """
+        Apply the preset to a glyph image.
+        Args:
+            image: The glyph image.
+            link (bool, optional): Link the image to the preset, so that it is
+                updated when the preset changes (see `linking.LinkedPresetsIndex`),
+                or unlink it from its preset if False.
+        """
         if not image:
             return
-        image.prepareUndo(f"Apply Image Preset {self.name!r}")
-        color = self._convertUserValueToFilterValue("color", ignoreColorOpacity=False)
-        image.color = tuple(color) if color is not None else None
-        image.brightness = self._convertUserValueToFilterValue("brightness")
-        image.contrast = self._convertUserValueToFilterValue("contrast")
-        image.saturation = self._convertUserValueToFilterValue("saturation")
-        image.sharpness = self._convertUserValueToFilterValue("sharpness")
+        if link is not None and image.glyph is not None:
+            if link:
+                linkedPresetsIndex.link(image.glyph, self.name)
+            else:
+                linkedPresetsIndex.unlink(image.glyph)
+        snapshot = self.snapshot()
+        image.prepareUndo(f"Apply Image Preset {snapshot.name!r}")
+        image.color = snapshot.color
+        image.brightness = snapshot.brightness
+        image.contrast = snapshot.contrast
+        image.saturation = snapshot.saturation
+        image.sharpness = snapshot.sharpness
         image.performUndo()
         image.changed()
 
+    def compileLUT(self):
+        """
+        Compile the color transforms of the preset to lookup tables, cached
+        per preset version (see `colorLUT.ColorLUT`).
+        """
+        # NumPy is only imported when needed
+        from .colorLUT import compileLUT
+
+        return compileLUT(self.snapshot())
+
+    def applyToPixels(self, pixels):
+        """
+        Apply the color transforms of the preset to a (height, width, 4)
+        uint8 RGBA array through its lookup tables, returning a new array.
+        Sharpness, a spatial filter, is not applied.
+        """
+        return self.compileLUT().apply(pixels)
+
+    def applyToRawImageFile(self, inputPath, outputPath, width, height, **kwargs):
+        """
+        Apply the color transforms of the preset to a raw (height, width, 4)
+        uint8 RGBA file out of core, tile by tile, streaming the result to
+        another raw file (see `tiledProcessing.applyLUTToRawFile`). Use
+        `tiledProcessing.writeRawImageFile` to decode an image to a raw file.
+        """
+        from .tiledProcessing import applyLUTToRawFile
+
+        applyLUTToRawFile(
+            self.compileLUT(), inputPath, outputPath, width, height, **kwargs
+        )
+
     def _saveDefaultsIfAddedToManager(self):
-        if self._addedToManager:
+        if self._addedToManager and not self._holdSaves:
             ImagePresetsManager.savePresetsToDefaults()
 
     def saveToDefaults(self):
@@ -513,112 +788,217 @@ class ImagePreset:
 
     # UI methods
 
-    def makeMenuItem(self, callback=None):
-        # initialize menu item
-        target = None
+    def makeMenuItem(self, callback=None, target=None):
+        snapshot = self.snapshot()
+
+        # initialize menu item, sharing the target if one is given
         action = ""
-        if callback is not None:
+        if target is not None:
+            action = "action:"
+        elif callback is not None:
             target = CallbackWrapper(callback)
             self._menuItemTargets.append(target)
             action = "action:"
         item = AppKit.NSMenuItem.alloc().initWithTitle_action_keyEquivalent_(
-            self.name, action, ""
+            snapshot.name, action, ""
         )
         if target is not None:
             item.setTarget_(target)
 
-        # extract placeholder image
-        image = ExtensionBundle("ImagePresets").get("placeholder")
-        size = image.size()
-        scale = 16 / size.height
-        image.setSize_((size.width * scale, size.height * scale))
-        size = image.size()
-
-        # create a rounded rectangle path
-        roundedRectPath = (
-            AppKit.NSBezierPath.bezierPathWithRoundedRect_xRadius_yRadius_(
-                AppKit.NSMakeRect(0, 0, size.width, size.height), 2, 2
-            )
-        )
+        # set menu item image, rendered once per preset version
+        item.setImage_(thumbnailRenderer.thumbnailForSnapshot(snapshot))
+        item.setRepresentedObject_(self)
 
-        # create a new image with rounded corners
-        adjustedImage = AppKit.NSImage.alloc().initWithSize_((size.width, size.height))
-        adjustedImage.lockFocus()
-        roundedRectPath.addClip()
-        image.drawAtPoint_fromRect_operation_fraction_(
-            AppKit.NSZeroPoint,
-            AppKit.NSMakeRect(0, 0, size.width, size.height),
-            AppKit.NSCompositingOperationSourceOver,
-            1.0,
-        )
-        adjustedImage.unlockFocus()
+        return item
 
-        # apply false color transformation
-        if self.color is not None:
-            falseColorFilter = CIFilter.filterWithName_("CIFalseColor")
-            falseColorFilter.setDefaults()
-            falseColorFilter.setValue_forKey_(
-                AppKit.CIImage.imageWithData_(adjustedImage.TIFFRepresentation()),
-                "inputImage",
-            )
-            falseColorFilter.setValue_forKey_(
-                AppKit.CIColor.colorWithRed_green_blue_alpha_(*self.color.normalized()),
-                "inputColor0",
-            )
-            falseColorFilter.setValue_forKey_(
-                AppKit.CIColor.colorWithRed_green_blue_alpha_(1, 1, 1, 1), "inputColor1"
-            )
-            adjustedImage = falseColorFilter.valueForKey_("outputImage")
-
-        # apply brightness, contrast and saturation adjustments
-        colorControlsFilter = CIFilter.filterWithName_("CIColorControls")
-        colorControlsFilter.setDefaults()
-        colorControlsFilter.setValue_forKey_(adjustedImage, "inputImage")
-        colorControlsFilter.setValue_forKey_(
-            self._convertUserValueToFilterValue("brightness"), "inputBrightness"
-        )
-        colorControlsFilter.setValue_forKey_(
-            self._convertUserValueToFilterValue("contrast"), "inputContrast"
-        )
-        colorControlsFilter.setValue_forKey_(
-            self._convertUserValueToFilterValue("saturation"), "inputSaturation"
-        )
-        adjustedImage = colorControlsFilter.valueForKey_("outputImage")
-
-        noiseReductionFilter = CIFilter.filterWithName_("CINoiseReduction")
-        noiseReductionFilter.setDefaults()
-        noiseReductionFilter.setValue_forKey_(adjustedImage, "inputImage")
-        noiseReductionFilter.setValue_forKey_(0, "inputNoiseLevel")
-        noiseReductionFilter.setValue_forKey_(
-            self._convertUserValueToFilterValue("sharpness"), "inputSharpness"
+
+_menuGroupSeparator = " - "
+
+
+def _groupPresetsBy(presets, key):
+    groups = {}
+    for preset in presets:
+        groups.setdefault(key(preset), []).append(preset)
+    return groups
+
+
+def groupPresets(presets, maxItems=25, prefixLength=0):
+    """
+    Group presets for a menu showing at most about `maxItems` entries.
+
+    Presets are first grouped by the part of their name before " - ", then,
+    if there are still too many entries, by their first characters.
+    Args:
+        presets (iterable): The `ImagePreset` objects to group.
+        maxItems (int): The number of presets above which they are grouped.
+        prefixLength (int): The length of the name prefix shared by the presets.
+    Returns:
+        A list of entries, either `ImagePreset` objects or (title, presets,
+        prefixLength) tuples for the groups.
+    """
+    presets = list(presets)
+    if len(presets) <= maxItems:
+        return presets
+    groups = None
+    if prefixLength == 0:
+        groups = _groupPresetsBy(
+            presets, lambda p: p.name.split(_menuGroupSeparator)[0]
         )
-        adjustedImage = noiseReductionFilter.valueForKey_("outputImage")
+        if not 1 < len(groups) <= maxItems:
+            groups = None
+        else:
+            titles = {title: title for title in groups}
+    if groups is None:
+        # Lengthen the prefix until the presets are split
+        maxLength = max(len(p.name) for p in presets)
+        length = prefixLength + 1
+        while True:
+            groups = _groupPresetsBy(presets, lambda p: p.name[:length])
+            if len(groups) > 1 or length >= maxLength:
+                break
+            length += 1
+        titles = {prefix: f"{prefix}…" for prefix in groups}
+        prefixLength = length
+    entries = []
+    for key, members in groups.items():
+        if len(members) == 1:
+            entries.append(members[0])
+        else:
+            entries.append((titles[key], members, prefixLength))
+    return entries
 
-        # convert CIImage back to NSImage
-        rep = AppKit.NSCIImageRep.imageRepWithCIImage_(adjustedImage)
-        transformedImage = AppKit.NSImage.alloc().initWithSize_(rep.size())
-        transformedImage.addRepresentation_(rep)
-        transformedImage.setSize_(size)
 
-        # set menu item image
-        item.setImage_(transformedImage)
-        item.setRepresentedObject_(self)
+class ImagePresetsMenuDelegate(AppKit.NSObject):
+    """
+    Populate a presets menu only when it is about to be shown, and report the
+    highlighted preset so that it can be previewed.
+    """
 
-        # set callback
-        if callback is not None:
-            ...
+    def menuNeedsUpdate_(self, menu):
+        if self.populated:
+            return
+        self.populated = True
+        presets = self.presets
+        if presets is None:
+            presets = ImagePresetsManager.getPresets()
+        for entry in groupPresets(presets, self.maxItems, self.prefixLength):
+            if isinstance(entry, ImagePreset):
+                item = entry.makeMenuItem(target=self.target)
+            else:
+                title, members, prefixLength = entry
+                item = makeLazyPresetsMenuItem(
+                    title,
+                    target=self.target,
+                    presets=members,
+                    maxItems=self.maxItems,
+                    prefixLength=prefixLength,
+                    previewCallback=self.previewCallback,
+                )
+            menu.addItem_(item)
 
-        return item
+    def menu_willHighlightItem_(self, menu, item):
+        if self.previewCallback is None:
+            return
+        preset = item.representedObject() if item is not None else None
+        self.previewCallback(preset if isinstance(preset, ImagePreset) else None)
+
+    def menuDidClose_(self, menu):
+        if self.previewCallback is not None:
+            self.previewCallback(None)
+
+
+def makeLazyPresetsMenuItem(
+    title,
+    callback=None,
+    target=None,
+    presets=None,
+    maxItems=25,
+    prefixLength=0,
+    previewCallback=None,
+):
+    """
+    Make a menu item with a submenu of presets, grouped in nested submenus
+    for large libraries. Submenus and their thumbnails are only made when
+    they are about to be shown, so making the item takes constant time.
+    Args:
+        title (str): The title of the menu item.
+        callback (callable, optional): Called with the chosen preset menu item.
+        target (optional): A shared `CallbackWrapper`, used instead of callback.
+        presets (iterable, optional): The presets of the submenu, the
+            registered ones when it is shown if None.
+        maxItems (int): The number of presets above which they are grouped.
+        prefixLength (int): The length of the name prefix shared by the presets.
+        previewCallback (callable, optional): Called with the highlighted
+            preset, or None when no preset is highlighted anymore, to preview
+            presets without applying them.
+    """
+    if target is None and callback is not None:
+        target = CallbackWrapper(callback)
+    delegate = ImagePresetsMenuDelegate.alloc().init()
+    delegate.populated = False
+    delegate.presets = presets
+    delegate.target = target
+    delegate.maxItems = maxItems
+    delegate.prefixLength = prefixLength
+    delegate.previewCallback = previewCallback
+    menu = AppKit.NSMenu.alloc().initWithTitle_(title)
+    menu.setDelegate_(delegate)
+    item = AppKit.NSMenuItem.alloc().initWithTitle_action_keyEquivalent_(title, "", "")
+    item.setSubmenu_(menu)
+    # The menu doesn't retain its delegate
+    item.setRepresentedObject_(delegate)
+    return item
 
 
 class ImagePresetsManager:
-    """"""
+    """
+    The registry of the image presets saved to the extension defaults.
+
+    Writers hold a lock and publish a new tuple in `presets` instead of
+    mutating it, so readers on any thread can use `getPresets` without
+    locking and always get a consistent list.
+    """
+
+    presets = ()
+    _presetsByName = {}
+    _lock = _presetsLock
 
-    presets = []
-    for name, data in getExtensionDefault(_LIB_KEY("presets"), fallback={}).items():
-        __p = ImagePreset.fromDict(dict(**data, name=name))
-        __p._addedToManager = True
-        presets.append(__p)
+    # Version kept when a preset was changed both by this process and by
+    # another one since the last sync: "local" or "stored"
+    conflictResolution = "local"
+
+    _syncedRevision = None
+    _syncedData = {}
+
+    @classmethod
+    def _publishPresets(cls, presets):
+        presets = tuple(presets)
+        cls._presetsByName = {p.name: p for p in presets}
+        cls.presets = presets
+
+    @classmethod
+    def _presetsFromDefaults(cls):
+        return [
+            ImagePreset.fromDict(dict(**data, name=name))
+            for name, data in getExtensionDefault(
+                _LIB_KEY("presets"), fallback={}
+            ).items()
+        ]
+
+    @classmethod
+    def getPresets(cls):
+        """
+        Return a tuple of the registered presets, unaffected by later changes
+        to the list.
+        """
+        return cls.presets
+
+    @classmethod
+    def getSnapshots(cls):
+        """
+        Return a tuple of `ImagePresetSnapshot` of the registered presets.
+        """
+        return tuple(p.snapshot() for p in cls.presets)
 
     @classmethod
     def hasPresets(cls):
@@ -626,37 +1006,42 @@ class ImagePresetsManager:
 
     @classmethod
     def hasPresetName(cls, name: str):
-        for p in cls.presets:
-            if p.name == name:
-                return True
-        return False
+        return name in cls._presetsByName
 
     @classmethod
     def getPresetByName(cls, name: str):
-        for p in cls.presets:
-            if p.name == name:
-                return p
-        return None
+        return cls._presetsByName.get(name)
+
+    @classmethod
+    def isRegistered(cls, preset: ImagePreset):
+        """
+        Return whether a preset is the registered instance of its name, as
+        opposed to a copy or a preset that was never added.
+        """
+        return cls._presetsByName.get(preset.name) is preset
 
     @classmethod
     def addPreset(cls, preset: ImagePreset):
-        assert preset.name not in [p.name for p in cls.presets], (
-            f"{preset.name!r} is a name already used by another preset"
-        )
-        postEvent("imagePresetsManagerWillAddPreset", preset=preset)
-        cls.presets.append(preset)
-        preset._addedToManager = True
-        cls.savePresetsToDefaults()
-        postEvent("imagePresetsManagerDidAddPreset", preset=preset)
+        with cls._lock:
+            assert preset.name not in cls._presetsByName, (
+                f"{preset.name!r} is a name already used by another preset"
+            )
+            _postEvent("imagePresetsManagerWillAddPreset", preset=preset)
+            preset._addedToManager = True
+            cls._publishPresets((*cls.presets, preset))
+            cls.savePresetsToDefaults()
+        _postEvent("imagePresetsManagerDidAddPreset", preset=preset)
 
     @classmethod
     def removePreset(cls, preset: ImagePreset):
-        if preset in cls.presets:
-            postEvent("imagePresetsManagerWillRemovePreset", preset=preset)
+        with cls._lock:
+            if preset not in cls.presets:
+                return
+            _postEvent("imagePresetsManagerWillRemovePreset", preset=preset)
             preset._addedToManager = False
-            cls.presets.remove(preset)
+            cls._publishPresets(p for p in cls.presets if p is not preset)
             cls.savePresetsToDefaults()
-            postEvent("imagePresetsManagerDidRemovePreset", preset=preset)
+        _postEvent("imagePresetsManagerDidRemovePreset", preset=preset)
 
     @classmethod
     def removePresetByName(cls, presetName: str):
@@ -664,34 +1049,294 @@ class ImagePresetsManager:
         if preset is not None:
             cls.removePreset(preset)
 
+    @classmethod
+    def findConflicts(cls, presets, replace=False):
+        """
+        Check a batch of presets before adding them to the manager.
+        Args:
+            presets (iterable): The `ImagePreset` objects to check.
+            replace (bool): Whether the batch replaces the registered presets,
+                in which case their names are not considered as used.
+        Returns:
+            A list of (preset, reason) tuples, one per conflicting preset.
+        """
+        usedNames = set() if replace else set(cls._presetsByName)
+        conflicts = []
+        for preset in presets:
+            if preset.name in usedNames:
+                reason = f"{preset.name!r} is a name already used by another preset"
+                conflicts.append((preset, reason))
+            usedNames.add(preset.name)
+        return conflicts
+
+    @classmethod
+    def _assertNoConflicts(cls, conflicts):
+        assert not conflicts, "Some presets can't be added:\n" + "\n".join(
+            f"- {reason}" for _, reason in conflicts
+        )
+
+    @classmethod
+    def addPresets(cls, presets, skipConflicts=False):
+        """
+        Add several presets at once, saving the defaults and posting the
+        events a single time.
+        Args:
+            presets (iterable): The `ImagePreset` objects to add.
+            skipConflicts (bool): Leave out the presets whose name is already
+                used instead of failing.
+        Returns:
+            A tuple of the added presets.
+        """
+        with cls._lock:
+            presets = tuple(presets)
+            conflicts = cls.findConflicts(presets)
+            if skipConflicts:
+                conflicting = {id(p) for p, _ in conflicts}
+                presets = tuple(p for p in presets if id(p) not in conflicting)
+            else:
+                cls._assertNoConflicts(conflicts)
+            if not presets:
+                return presets
+            _postEvent("imagePresetsManagerWillAddPresets", presets=presets)
+            for preset in presets:
+                preset._addedToManager = True
+            cls._publishPresets((*cls.presets, *presets))
+            cls.savePresetsToDefaults()
+        _postEvent("imagePresetsManagerDidAddPresets", presets=presets)
+        return presets
+
+    @classmethod
+    def removePresets(cls, presets):
+        """
+        Remove several presets at once, saving the defaults and posting the
+        events a single time.
+        Args:
+            presets (iterable): The `ImagePreset` objects to remove,
+                unregistered ones being ignored.
+        Returns:
+            A tuple of the removed presets.
+        """
+        with cls._lock:
+            removedIds = {id(p) for p in presets}
+            presets = tuple(p for p in cls.presets if id(p) in removedIds)
+            if not presets:
+                return presets
+            _postEvent("imagePresetsManagerWillRemovePresets", presets=presets)
+            for preset in presets:
+                preset._addedToManager = False
+            cls._publishPresets(p for p in cls.presets if id(p) not in removedIds)
+            cls.savePresetsToDefaults()
+        _postEvent("imagePresetsManagerDidRemovePresets", presets=presets)
+        return presets
+
+    @classmethod
+    def replacePresets(cls, presets):
+        """
+        Replace all the registered presets, saving the defaults a single time
+        and posting one batch of removal events and one batch of addition
+        events.
+        Args:
+            presets (iterable): The `ImagePreset` objects to register.
+        """
+        with cls._lock:
+            presets = tuple(presets)
+            cls._assertNoConflicts(cls.findConflicts(presets, replace=True))
+            keptIds = {id(p) for p in presets}
+            currentIds = {id(p) for p in cls.presets}
+            removed = tuple(p for p in cls.presets if id(p) not in keptIds)
+            added = tuple(p for p in presets if id(p) not in currentIds)
+            if removed:
+                _postEvent("imagePresetsManagerWillRemovePresets", presets=removed)
+            if added:
+                _postEvent("imagePresetsManagerWillAddPresets", presets=added)
+            for preset in removed:
+                preset._addedToManager = False
+            for preset in added:
+                preset._addedToManager = True
+            cls._publishPresets(presets)
+            cls.savePresetsToDefaults()
+        if removed:
+            _postEvent("imagePresetsManagerDidRemovePresets", presets=removed)
+        if added:
+            _postEvent("imagePresetsManagerDidAddPresets", presets=added)
+
+    @classmethod
+    def findDuplicates(cls):
+        """
+        Find the registered presets sharing the same filter values.
+        Returns:
+            A list of tuples of presets with the same `contentHash`, in the
+            manager's order, only listing groups of more than one preset.
+        """
+        groups = {}
+        for preset in cls.presets:
+            groups.setdefault(preset.contentHash, []).append(preset)
+        return [tuple(group) for group in groups.values() if len(group) > 1]
+
+    @classmethod
+    def dedupe(cls):
+        """
+        Remove the duplicates of presets, keeping the first preset of each
+        group returned by `findDuplicates`. Images linked to a removed
+        duplicate are linked to the kept preset instead.
+        Returns:
+            A tuple of the removed presets.
+        """
+        with cls._lock:
+            duplicates = []
+            for kept, *others in cls.findDuplicates():
+                for preset in others:
+                    linkedPresetsIndex.renamePreset(preset.name, kept.name)
+                duplicates.extend(others)
+            return cls.removePresets(duplicates)
+
+    @classmethod
+    def _readDefaults(cls):
+        # Return the stored revision and presets data, normalized to the
+        # format of `ImagePreset.asDict`
+        revision = getExtensionDefault(_LIB_KEY("revision"), fallback=None)
+        data = {
+            p.name: p.asDict(includeName=False) for p in cls._presetsFromDefaults()
+        }
+        return revision, data
+
+    @classmethod
+    def _applyPresetsData(cls, data):
+        # Make the registered presets match the data, a dict of preset dicts
+        # by name, updating the existing presets in place
+        presets = []
+        added = []
+        changed = []
+        for name, presetData in data.items():
+            preset = cls._presetsByName.get(name)
+            if preset is None:
+                preset = ImagePreset.fromDict(dict(**presetData, name=name))
+                added.append(preset)
+            elif preset.update(presetData, saveToDefaults=False):
+                changed.append(preset)
+            presets.append(preset)
+        removed = tuple(p for p in cls.presets if p.name not in data)
+        added = tuple(added)
+        if removed:
+            _postEvent("imagePresetsManagerWillRemovePresets", presets=removed)
+        if added:
+            _postEvent("imagePresetsManagerWillAddPresets", presets=added)
+        for preset in removed:
+            preset._addedToManager = False
+        for preset in added:
+            preset._addedToManager = True
+        cls._publishPresets(presets)
+        if removed:
+            _postEvent("imagePresetsManagerDidRemovePresets", presets=removed)
+        if added:
+            _postEvent("imagePresetsManagerDidAddPresets", presets=added)
+        return dict(added=added, removed=removed, changed=tuple(changed))
+
     @classmethod
     def reloadPresets(cls):
-        presets = [
-            ImagePreset.fromDict(dict(**data, name=name))
-            for name, data in getExtensionDefault(
-                _LIB_KEY("presets"), fallback={}
-            ).items()
-        ]
-        for p in presets:
-            p._addedToManager = True
-        cls.presets = presets
-        cls.savePresetsToDefaults()
+        """
+        Update the registered presets from the extension defaults, discarding
+        the changes that were not saved.
+
+        Presets are matched by name: changed ones are updated in place, so
+        references to them stay valid, and only the presets that were added,
+        removed or changed post events.
+        Returns:
+            A dict of tuples of the "added", "removed" and "changed" presets.
+        """
+        with cls._lock:
+            revision, data = cls._readDefaults()
+            result = cls._applyPresetsData(data)
+            cls._syncedRevision = revision
+            cls._syncedData = data
+        return result
+
+    @classmethod
+    def hasExternalChanges(cls):
+        """
+        Return True if another process saved the presets since they were
+        last synced by this one.
+        """
+        revision = getExtensionDefault(_LIB_KEY("revision"), fallback=None)
+        return revision != cls._syncedRevision
+
+    @classmethod
+    def syncPresets(cls, force=False):
+        """
+        Merge the changes saved by other processes (other RoboFont instances,
+        scripts) into the registered presets.
+
+        Only the stored revision is read when nothing changed. Otherwise each
+        preset is merged on its own against the data of the last sync: a
+        preset changed on one side only takes that side's version, and a
+        preset changed on both sides is resolved with `conflictResolution`.
+        Args:
+            force (bool): Merge even if the stored revision didn't change.
+        Returns:
+            A dict of tuples of the "added", "removed" and "changed" presets,
+            plus the "conflicts" names, or None if nothing was merged.
+        """
+        with cls._lock:
+            if not force and not cls.hasExternalChanges():
+                return None
+            revision, stored = cls._readDefaults()
+            base = cls._syncedData
+            local = {p.name: p.asDict(includeName=False) for p in cls.presets}
+            merged = {}
+            conflicts = []
+            for name in (*local, *(n for n in stored if n not in local)):
+                baseData = base.get(name)
+                localData = local.get(name)
+                storedData = stored.get(name)
+                if localData == storedData or storedData == baseData:
+                    data = localData
+                elif localData == baseData:
+                    data = storedData
+                else:
+                    conflicts.append(name)
+                    if cls.conflictResolution == "local":
+                        data = localData
+                    else:
+                        data = storedData
+                if data is not None:
+                    merged[name] = data
+            result = cls._applyPresetsData(merged)
+            if merged != stored:
+                cls._writeDefaults(merged)
+            else:
+                cls._syncedRevision = revision
+                cls._syncedData = merged
+        result["conflicts"] = tuple(conflicts)
+        return result
 
     @classmethod
     def loadFactoryPresets(cls, overwrite=True):
+        factoryPresets = ImagePreset.getFactoryPresets()
         if overwrite:
-            cls.presets = []
-        for preset in ImagePreset.getFactoryPresets():
-            try:
-                cls.addPreset(preset)
-            except:
-                pass
-        cls.savePresetsToDefaults()
+            cls.replacePresets(factoryPresets)
+        else:
+            cls.addPresets(factoryPresets, skipConflicts=True)
 
     @classmethod
-    def savePresetsToDefaults(cls):
-        data = {preset.name: preset.asDict(includeName=False) for preset in cls.presets}
+    def _writeDefaults(cls, data):
         setExtensionDefault(_LIB_KEY("presets"), data)
+        revision = uuid.uuid4().hex
+        setExtensionDefault(_LIB_KEY("revision"), revision)
+        cls._syncedRevision = revision
+        cls._syncedData = data
+
+    @classmethod
+    def savePresetsToDefaults(cls):
+        with cls._lock:
+            if cls.hasExternalChanges():
+                # Merge the other processes' changes instead of overwriting them
+                cls.syncPresets(force=True)
+                return
+            data = {
+                preset.name: preset.asDict(includeName=False)
+                for preset in cls.presets
+            }
+            cls._writeDefaults(data)
 
     # UI methods
 
@@ -708,3 +1353,19 @@ class ImagePresetsManager:
         for preset in cls.presets:
             items.append(preset.makeMenuItem(callback))
         return items
+
+    @classmethod
+    def makeLazyMenuItem(cls, title, callback=None, maxItems=25, previewCallback=None):
+        """
+        Make a menu item with a lazily populated and grouped submenu of the
+        registered presets (see `makeLazyPresetsMenuItem`).
+        """
+        return makeLazyPresetsMenuItem(
+            title,
+            callback=callback,
+            maxItems=maxItems,
+            previewCallback=previewCallback,
+        )
+
+
+ImagePresetsManager.reloadPresets()
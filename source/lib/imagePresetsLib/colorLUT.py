@@ -0,0 +1,209 @@
+import collections
+import time
+
+import numpy
+
+# Luminance weights used by Core Image
+_luminanceWeights = numpy.array((0.2125, 0.7154, 0.0721), dtype=numpy.float32)
+
+_lutCacheSize = 64
+_lutCache = collections.OrderedDict()
+
+
+def _brightnessContrast(snapshot, values):
+    # Brightness, then contrast around mid-gray
+    return numpy.clip(
+        (values + snapshot.brightness - 0.5) * snapshot.contrast + 0.5, 0, 1
+    )
+
+
+def _colorControls(snapshot, rgb):
+    if snapshot.saturation != 1:
+        luminance = (rgb @ _luminanceWeights)[..., None]
+        rgb = luminance + snapshot.saturation * (rgb - luminance)
+    return _brightnessContrast(snapshot, rgb)
+
+
+def _falseColor(snapshot, luminance):
+    color0 = numpy.array(snapshot.color[:3], dtype=numpy.float32)
+    color1 = numpy.ones(3, dtype=numpy.float32)
+    return color0 + numpy.clip(luminance, 0, 1)[..., None] * (color1 - color0)
+
+
+def transformColors(snapshot, rgb):
+    """
+    Apply the color controls and false color of a preset snapshot to colors.
+    Args:
+        snapshot (ImagePresetSnapshot): The preset values in filter space.
+        rgb: A (..., 3) float array of colors in the 0-1 range.
+    Returns:
+        A (..., 3) float32 array of the transformed colors.
+    """
+    rgb = _colorControls(snapshot, numpy.asarray(rgb, dtype=numpy.float32))
+    if snapshot.color is not None:
+        rgb = _falseColor(snapshot, rgb @ _luminanceWeights)
+    return rgb.astype(numpy.float32)
+
+
+def _toUInt8(values):
+    return (values * 255 + 0.5).astype(numpy.uint8)
+
+
+def _withAlpha(snapshot, pixels, rgb):
+    result = numpy.empty_like(pixels)
+    result[..., :3] = rgb
+    if snapshot.opacity == 1:
+        result[..., 3] = pixels[..., 3]
+    else:
+        result[..., 3] = _toUInt8(pixels[..., 3] * (snapshot.opacity / 255))
+    return result
+
+
+def applyDirect(snapshot, pixels):
+    """
+    Apply a preset snapshot to an image by evaluating the filters' math for
+    every pixel. Sharpness, a spatial filter, is not applied.
+    Args:
+        snapshot (ImagePresetSnapshot): The preset values in filter space.
+        pixels: A (height, width, 4) uint8 RGBA array, without premultiplied alpha.
+    Returns:
+        A new (height, width, 4) uint8 RGBA array.
+    """
+    rgb = transformColors(snapshot, pixels[..., :3] / numpy.float32(255))
+    return _withAlpha(snapshot, pixels, _toUInt8(rgb))
+
+
+class ColorLUT:
+    """
+    A preset's color transforms compiled to per-channel lookup tables.
+
+    Color controls desaturate linearly, so each channel's value before
+    brightness and contrast is its own table entry plus the sum of three
+    per-channel luminance tables. Brightness and contrast then go through a
+    table over that range, and false color through a table over the
+    luminance of the result.
+    """
+
+    # Saturation mixes the channels into the range [-1, 2] at most
+    _mixedRange = (-1, 2)
+    _mixedLevels = 4096
+    _luminanceLevels = 1024
+
+    def __init__(self, snapshot):
+        self.key = snapshot.key
+        self.snapshot = snapshot
+        levels = numpy.arange(256, dtype=numpy.float32) / 255
+        if snapshot.saturation == 1:
+            self.channelTable = _toUInt8(_brightnessContrast(snapshot, levels))
+            self.mixTables = None
+        else:
+            low, high = self._mixedRange
+            scale = numpy.float32((self._mixedLevels - 1) / (high - low))
+            # Table indexes of the desaturated values, as float offsets
+            self.channelTable = (snapshot.saturation * levels) * scale
+            self.mixTables = (
+                (1 - snapshot.saturation) * _luminanceWeights[:, None] * levels
+            ) * scale
+            self.mixOffset = numpy.float32(-low * scale + 0.5)
+            mixed = numpy.linspace(low, high, self._mixedLevels, dtype=numpy.float32)
+            self.mixedTable = _toUInt8(_brightnessContrast(snapshot, mixed))
+        if snapshot.color is None:
+            self.colorTable = None
+        else:
+            scale = self._luminanceLevels - 1
+            self.luminanceTables = numpy.round(
+                _luminanceWeights[:, None] * levels * scale
+            ).astype(numpy.intp)
+            luminance = numpy.linspace(
+                0, 1, self._luminanceLevels, dtype=numpy.float32
+            )
+            self.colorTable = _toUInt8(_falseColor(snapshot, luminance))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.key!r})"
+
+    def _applyColorControls(self, rgb):
+        if self.mixTables is None:
+            return self.channelTable[rgb]
+        mix = self.mixTables[0][rgb[..., 0]]
+        mix += self.mixTables[1][rgb[..., 1]]
+        mix += self.mixTables[2][rgb[..., 2]]
+        mix += self.mixOffset
+        result = numpy.empty_like(rgb)
+        for channel in range(3):
+            index = self.channelTable[rgb[..., channel]]
+            index += mix
+            result[..., channel] = self.mixedTable[index.astype(numpy.intp)]
+        return result
+
+    def _applyFalseColor(self, rgb):
+        luminance = self.luminanceTables[0][rgb[..., 0]]
+        luminance += self.luminanceTables[1][rgb[..., 1]]
+        luminance += self.luminanceTables[2][rgb[..., 2]]
+        return self.colorTable[luminance]
+
+    def apply(self, pixels):
+        """
+        Apply the tables to a (height, width, 4) uint8 RGBA array, without
+        premultiplied alpha, returning a new array.
+        """
+        rgb = self._applyColorControls(pixels[..., :3])
+        if self.colorTable is not None:
+            rgb = self._applyFalseColor(rgb)
+        return _withAlpha(self.snapshot, pixels, rgb)
+
+
+def compileLUT(snapshot):
+    """
+    Return the `ColorLUT` of a preset snapshot, cached per preset version.
+    """
+    key = snapshot.key
+    lut = _lutCache.get(key)
+    if lut is None:
+        lut = ColorLUT(snapshot)
+        _lutCache[key] = lut
+        while len(_lutCache) > _lutCacheSize:
+            _lutCache.popitem(last=False)
+    else:
+        _lutCache.move_to_end(key)
+    return lut
+
+
+def benchmarkLUT(snapshot, width=4000, height=4000, repeat=3):
+    """
+    Compare applying a preset snapshot with lookup tables against the direct
+    arithmetic on a random image, printing and returning the best times in
+    seconds along with the largest channel difference.
+    """
+    pixels = numpy.random.default_rng(0).integers(
+        0, 256, (height, width, 4), dtype=numpy.uint8
+    )
+    start = time.perf_counter()
+    lut = ColorLUT(snapshot)
+    compileTime = time.perf_counter() - start
+
+    def best(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(pixels)
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    directTime, direct = best(lambda p: applyDirect(snapshot, p))
+    lutTime, looked = best(lut.apply)
+    difference = int(
+        numpy.abs(direct.astype(numpy.int16) - looked.astype(numpy.int16)).max()
+    )
+    results = dict(
+        compile=compileTime,
+        direct=directTime,
+        lut=lutTime,
+        maxDifference=difference,
+    )
+    print(
+        f"{width}x{height}: LUT compile {compileTime * 1000:.1f}ms, "
+        f"direct {directTime * 1000:.1f}ms, LUT {lutTime * 1000:.1f}ms "
+        f"({directTime / lutTime:.1f}x), max difference {difference}"
+    )
+    return results
@@ -0,0 +1,242 @@
+import AppKit
+import Quartz
+from Quartz import CIFilter
+
+# Parameter values for which a filter leaves the image untouched
+_identityParameters = dict(
+    colorControls=dict(saturation=1, brightness=0, contrast=1),
+    noiseReduction=dict(noiseLevel=0, sharpness=0),
+)
+
+# Luminance weights used by Core Image
+_luminanceWeights = (0.2125, 0.7154, 0.0721)
+
+_ciFilterNames = dict(
+    colorControls="CIColorControls",
+    noiseReduction="CINoiseReduction",
+    falseColor="CIFalseColor",
+)
+
+_filterParameterKeys = ("name", "filterType")
+
+
+def _filterParameters(filterDict):
+    return {k: v for k, v in filterDict.items() if k not in _filterParameterKeys}
+
+
+def isIdentityFilter(filterDict):
+    """
+    Return True if the Merz filter dict leaves the image untouched.
+    """
+    identity = _identityParameters.get(filterDict["filterType"])
+    if identity is None:
+        return False
+    parameters = _filterParameters(filterDict)
+    return all(
+        parameters.get(key, default) == default for key, default in identity.items()
+    )
+
+
+def _changedColorControls(filterDict):
+    identity = _identityParameters["colorControls"]
+    return [
+        key
+        for key, default in identity.items()
+        if filterDict.get(key, default) != default
+    ]
+
+
+def _luminance(color):
+    return sum(c * w for c, w in zip(color[:3], _luminanceWeights))
+
+
+def _mixColors(color0, color1, factor):
+    return tuple(c0 + factor * (c1 - c0) for c0, c1 in zip(color0, color1))
+
+
+def _mergeFilters(first, second):
+    """
+    Return a single filter dict equivalent to applying first then second,
+    or None if the two filters can't be merged exactly.
+    """
+    filterType = first["filterType"]
+    if filterType != second["filterType"]:
+        return None
+    if filterType == "colorControls":
+        # Only merge stages changing the same single parameter: saturations and
+        # contrasts compose by multiplication, brightnesses by addition.
+        changed = _changedColorControls(first)
+        if len(changed) != 1 or _changedColorControls(second) != changed:
+            return None
+        key = changed[0]
+        merged = dict(first)
+        if key == "brightness":
+            merged[key] = first[key] + second[key]
+        else:
+            merged[key] = first[key] * second[key]
+        return merged
+    if filterType == "falseColor":
+        # falseColor maps the luminance linearly between two colors, so the
+        # second filter maps the first one's colors by their luminance.
+        color0, color1 = tuple(second["color0"]), tuple(second["color1"])
+        merged = dict(first)
+        merged["color0"] = _mixColors(color0, color1, _luminance(first["color0"]))
+        merged["color1"] = _mixColors(color0, color1, _luminance(first["color1"]))
+        return merged
+    return None
+
+
+def optimizeFilterDicts(filterDicts):
+    """
+    Optimize a chain of Merz filter dicts.
+    Args:
+        filterDicts (list): The filter dicts, in application order.
+    Returns:
+        A new list of filter dicts rendering the same image, with identity
+        filters dropped and adjacent compatible filters merged. Filters are
+        never reordered: sharpening and false color, for instance, only
+        commute when the false color's dark color is gray.
+    """
+    filters = [dict(fd) for fd in filterDicts if not isIdentityFilter(fd)]
+
+    merged = []
+    for fd in filters:
+        if merged:
+            mergedFilter = _mergeFilters(merged[-1], fd)
+            if mergedFilter is not None:
+                if isIdentityFilter(mergedFilter):
+                    merged.pop()
+                else:
+                    merged[-1] = mergedFilter
+                continue
+        merged.append(fd)
+
+    return merged
+
+
+# Rendering
+
+def _ciValue(value):
+    if isinstance(value, (int, float)):
+        return value
+    return AppKit.CIColor.colorWithRed_green_blue_alpha_(*value)
+
+
+def _ciInputKey(key):
+    return "input" + key[0].upper() + key[1:]
+
+
+def makeCIFilter(filterType):
+    ciFilter = CIFilter.filterWithName_(_ciFilterNames[filterType])
+    ciFilter.setDefaults()
+    return ciFilter
+
+
+def setCIFilterParameters(ciFilter, filterDict):
+    for key, value in _filterParameters(filterDict).items():
+        ciFilter.setValue_forKey_(_ciValue(value), _ciInputKey(key))
+
+
+def applyFilterDictsToCIImage(filterDicts, ciImage, ciFilters=None):
+    """
+    Apply a chain of Merz filter dicts to a CIImage with Core Image.
+    Args:
+        filterDicts (list): The filter dicts, in application order.
+        ciImage: The source CIImage.
+        ciFilters (dict, optional): A cache of CIFilter objects by filter type,
+            re-parameterized for each call instead of being created again.
+    Returns:
+        The filtered CIImage.
+    """
+    for fd in filterDicts:
+        filterType = fd["filterType"]
+        if ciFilters is None:
+            ciFilter = makeCIFilter(filterType)
+        else:
+            ciFilter = ciFilters.get(filterType)
+            if ciFilter is None:
+                ciFilter = ciFilters[filterType] = makeCIFilter(filterType)
+        ciFilter.setValue_forKey_(ciImage, "inputImage")
+        setCIFilterParameters(ciFilter, fd)
+        ciImage = ciFilter.valueForKey_("outputImage")
+    return ciImage
+
+
+def _renderCIImageBytes(ciImage, extent, context):
+    cgImage = context.createCGImage_fromRect_(ciImage, extent)
+    data = Quartz.CGDataProviderCopyData(Quartz.CGImageGetDataProvider(cgImage))
+    return bytes(data)
+
+
+def _makeVerificationImage(size=64):
+    # A hue/luminance gradient exercising every filter
+    image = AppKit.NSImage.alloc().initWithSize_((size, size))
+    image.lockFocus()
+    for x in range(size):
+        hue = x / size
+        for y in range(0, size, 4):
+            AppKit.NSColor.colorWithCalibratedHue_saturation_brightness_alpha_(
+                hue, 1, y / size, 1
+            ).set()
+            AppKit.NSRectFill(AppKit.NSMakeRect(x, y, 1, 4))
+    image.unlockFocus()
+    return AppKit.CIImage.imageWithData_(image.TIFFRepresentation())
+
+
+def verifyFilterOrder(filterDicts, optimizedFilterDicts):
+    """
+    Check that the optimized filter chain applies the remaining filter types
+    in the order of the unoptimized one, without rendering anything.
+    """
+
+    def filterTypes(fds):
+        types = []
+        for fd in fds:
+            if not isIdentityFilter(fd) and (
+                not types or types[-1] != fd["filterType"]
+            ):
+                types.append(fd["filterType"])
+        return types
+
+    original = filterTypes(filterDicts)
+    optimized = filterTypes(optimizedFilterDicts)
+    # Merged filters may disappear, but the others must keep their order
+    remaining = iter(original)
+    assert all(filterType in remaining for filterType in optimized), (
+        f"Optimized filters {optimized} are not in the order of {original}"
+    )
+
+
+def verifyOptimizedFilterDicts(filterDicts, ciImage=None, tolerance=2):
+    """
+    Check that the optimized filter chain renders the same image as the
+    unoptimized one.
+    Args:
+        filterDicts (list): The unoptimized filter dicts, in application order.
+        ciImage (optional): The CIImage to render, a generated gradient if None.
+        tolerance (int): The maximum channel difference allowed, out of 255.
+    Returns:
+        The maximum channel difference between both renders.
+    """
+    verifyFilterOrder(filterDicts, optimizeFilterDicts(filterDicts))
+    if ciImage is None:
+        ciImage = _makeVerificationImage()
+    extent = ciImage.extent()
+    context = AppKit.CIContext.contextWithOptions_(None)
+    reference = _renderCIImageBytes(
+        applyFilterDictsToCIImage(filterDicts, ciImage), extent, context
+    )
+    optimized = _renderCIImageBytes(
+        applyFilterDictsToCIImage(optimizeFilterDicts(filterDicts), ciImage),
+        extent,
+        context,
+    )
+    difference = max(
+        (abs(a - b) for a, b in zip(reference, optimized)),
+        default=0,
+    )
+    assert difference <= tolerance, (
+        f"Optimized filters differ from the original ones by {difference}, "
+        f"more than the {tolerance} tolerance"
+    )
+    return difference
@@ -0,0 +1,167 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import AppKit
+import numpy
+import Quartz
+
+# Luminance weights used by Core Image
+_luminanceWeights = numpy.array((0.2125, 0.7154, 0.0721), dtype=numpy.float32)
+
+imageFileExtensions = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif")
+
+
+def decodeImagePixels(data, maxPixelSize=None):
+    """
+    Decode image data to an RGBA array.
+    Args:
+        data (bytes or NSData): The encoded image data.
+        maxPixelSize (int, optional): Let ImageIO downsample the image while
+            decoding it, so that its largest side fits this size.
+    Returns:
+        A (height, width, 4) uint8 array with premultiplied alpha.
+    """
+    if not isinstance(data, AppKit.NSData):
+        data = AppKit.NSData.dataWithBytes_length_(data, len(data))
+    source = Quartz.CGImageSourceCreateWithData(data, None)
+    assert source is not None, "Image data can't be decoded"
+    if maxPixelSize is None:
+        cgImage = Quartz.CGImageSourceCreateImageAtIndex(source, 0, None)
+    else:
+        options = {
+            Quartz.kCGImageSourceCreateThumbnailFromImageAlways: True,
+            Quartz.kCGImageSourceCreateThumbnailWithTransform: True,
+            Quartz.kCGImageSourceThumbnailMaxPixelSize: maxPixelSize,
+        }
+        cgImage = Quartz.CGImageSourceCreateThumbnailAtIndex(source, 0, options)
+    width = Quartz.CGImageGetWidth(cgImage)
+    height = Quartz.CGImageGetHeight(cgImage)
+    context = Quartz.CGBitmapContextCreate(
+        None,
+        width,
+        height,
+        8,
+        width * 4,
+        Quartz.CGColorSpaceCreateDeviceRGB(),
+        Quartz.kCGImageAlphaPremultipliedLast,
+    )
+    Quartz.CGContextDrawImage(context, Quartz.CGRectMake(0, 0, width, height), cgImage)
+    rendered = Quartz.CGBitmapContextCreateImage(context)
+    bytesPerRow = Quartz.CGImageGetBytesPerRow(rendered)
+    buffer = Quartz.CGDataProviderCopyData(Quartz.CGImageGetDataProvider(rendered))
+    pixels = numpy.frombuffer(bytes(buffer), dtype=numpy.uint8)
+    return pixels.reshape(height, bytesPerRow)[:, : width * 4].reshape(height, width, 4)
+
+
+def imageStatistics(pixels, maxSamples=1_000_000, bins=256):
+    """
+    Compute the luminance and chroma statistics of an image.
+    Args:
+        pixels: A (height, width, 4) uint8 RGBA array with premultiplied alpha.
+        maxSamples (int): The number of pixels above which the image is
+            subsampled with a stride.
+        bins (int): The number of bins of the luminance histogram.
+    Returns:
+        A dict with the luminance "histogram", its "mean", and the mean
+        "chroma" of the opaque pixels, all in the 0-1 range.
+    """
+    height, width = pixels.shape[:2]
+    step = max(1, math.ceil(math.sqrt(height * width / maxSamples)))
+    sample = pixels[::step, ::step].reshape(-1, 4).astype(numpy.float32)
+    alpha = sample[:, 3]
+    sample = sample[alpha > 0]
+    if not len(sample):
+        return dict(histogram=numpy.zeros(bins, dtype=numpy.int64), mean=0, chroma=0)
+    rgb = sample[:, :3] / sample[:, 3:]
+    luminance = rgb @ _luminanceWeights
+    histogram, _ = numpy.histogram(luminance, bins=bins, range=(0, 1))
+    chroma = rgb.max(axis=1) - rgb.min(axis=1)
+    return dict(
+        histogram=histogram,
+        mean=float(luminance.mean()),
+        chroma=float(chroma.mean()),
+    )
+
+
+def histogramPercentile(histogram, percentile):
+    """
+    Return the luminance below which lies the given percentage of the
+    histogram's pixels, in the 0-1 range.
+    """
+    cumulative = numpy.cumsum(histogram)
+    if not cumulative[-1]:
+        return 0
+    index = numpy.searchsorted(cumulative, cumulative[-1] * percentile / 100)
+    return (index + 0.5) / len(histogram)
+
+
+def _clamp(value, rangeDescriptor):
+    return min(max(value, rangeDescriptor.min), rangeDescriptor.max)
+
+
+def presetValuesFromStatistics(
+    statistics,
+    filterDefaults,
+    lowPercentile=1,
+    highPercentile=99,
+    grayChroma=0.04,
+):
+    """
+    Propose preset values stretching the luminance range of an image.
+
+    Color controls add the brightness, then scale the distance to mid-gray by
+    the contrast, so the luminance percentiles are mapped to black and white.
+    Images whose mean chroma is below `grayChroma` are desaturated, to remove
+    the tint of scanned paper.
+    Args:
+        statistics (dict): As returned by `imageStatistics`.
+        filterDefaults (dict): The `ImagePreset.filterDefaults` ranges.
+    Returns:
+        A dict of brightness, contrast and saturation user values.
+    """
+    histogram = statistics["histogram"]
+    low = histogramPercentile(histogram, lowPercentile)
+    high = histogramPercentile(histogram, highPercentile)
+    spread = max(high - low, 1 / len(histogram))
+    contrast = 1 / spread
+    brightness = 0.5 - (low + high) / 2
+    saturation = 0 if statistics["chroma"] < grayChroma else 1
+    values = dict(brightness=brightness, contrast=contrast, saturation=saturation)
+    return {
+        name: round(_clamp(value * 100, filterDefaults[name]))
+        for name, value in values.items()
+    }
+
+
+def presetValuesFromImageData(data, filterDefaults, maxPixelSize=2048, **kwargs):
+    """
+    Decode image data, downsampled by ImageIO, and propose preset values
+    for it (see `presetValuesFromStatistics`).
+    """
+    pixels = decodeImagePixels(data, maxPixelSize=maxPixelSize)
+    return presetValuesFromStatistics(imageStatistics(pixels), filterDefaults, **kwargs)
+
+
+def presetValuesFromImageFolder(
+    folderPath, filterDefaults, maxWorkers=None, extensions=imageFileExtensions, **kwargs
+):
+    """
+    Propose preset values for each image of a folder, decoding and analyzing
+    them in parallel threads.
+    Returns:
+        A list of (fileName, values) tuples, sorted by file name.
+    """
+    fileNames = sorted(
+        fileName
+        for fileName in os.listdir(folderPath)
+        if os.path.splitext(fileName)[1].lower() in extensions
+    )
+
+    def analyze(fileName):
+        with open(os.path.join(folderPath, fileName), "rb") as f:
+            data = f.read()
+        return presetValuesFromImageData(data, filterDefaults, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        return list(zip(fileNames, executor.map(analyze, fileNames)))
@@ -12,14 +12,18 @@ imagePresetsManagerEvents = [
     "imagePresetsManagerDidAddPreset",
     "imagePresetsManagerWillRemovePreset",
     "imagePresetsManagerDidRemovePreset",
+    "imagePresetsManagerWillAddPresets",
+    "imagePresetsManagerDidAddPresets",
+    "imagePresetsManagerWillRemovePresets",
+    "imagePresetsManagerDidRemovePresets",
     "imagePresetsManagerPresetChanged",
 ]
 
 
 def imagePresetsManagerEventExtractor(subscriber, info):
-    attributes = ["old", "new", "preset"]
+    attributes = ["old", "new", "preset", "presets"]
+    data = info["lowLevelEvents"][-1]
     for attribute in attributes:
-        data = info["lowLevelEvents"][-1]
         if attribute in data:
             info[attribute] = data[attribute]
 
@@ -43,5 +47,4 @@ for event in imagePresetsManagerEvents:
         documentation=f"Send when the Image Presets Manager {documentation}.",
         eventInfoExtractionFunction=imagePresetsManagerEventExtractor,
         delay=0,
-        debug=True,
     )
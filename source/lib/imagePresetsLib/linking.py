@@ -0,0 +1,176 @@
+_LIB_KEY = lambda s: f"com.adbac.ImagePresets.{s}"
+
+# Name of the preset linked to a glyph's image, in the glyph lib
+linkedPresetLibKey = _LIB_KEY("linkedPreset")
+# Lists of [layerName, glyphName] by linked preset name, in the font lib
+linkedGlyphsLibKey = _LIB_KEY("linkedGlyphs")
+# Whether presets applied from the glyph editor menu are linked, in the
+# extension defaults
+linkAppliedPresetsDefaultKey = _LIB_KEY("linkAppliedPresets")
+
+
+class LinkedPresetsIndex:
+    """
+    A reverse index of the glyphs of open fonts whose image is linked to a
+    preset, so that only those glyphs are updated when the preset changes.
+
+    Links are stored in the glyph lib, and mirrored by preset name in the
+    font lib so that opening a font doesn't scan its glyphs.
+    """
+
+    def __init__(self):
+        self._fonts = {}
+        self._glyphs = {}
+
+    # Fonts
+
+    def addFont(self, font):
+        fontKey = font.naked()
+        self._fonts[fontKey] = font
+        for presetName, glyphs in font.lib.get(linkedGlyphsLibKey, {}).items():
+            entries = self._glyphs.setdefault(presetName, set())
+            for layerName, glyphName in glyphs:
+                entries.add((fontKey, layerName, glyphName))
+
+    def removeFont(self, font):
+        fontKey = font.naked()
+        self._fonts.pop(fontKey, None)
+        for presetName in list(self._glyphs):
+            entries = {e for e in self._glyphs[presetName] if e[0] is not fontKey}
+            if entries:
+                self._glyphs[presetName] = entries
+            else:
+                del self._glyphs[presetName]
+
+    def _writeFontLib(self, fontKey):
+        font = self._fonts.get(fontKey)
+        if font is None:
+            return
+        data = {}
+        for presetName, entries in self._glyphs.items():
+            glyphs = sorted(
+                [layerName, glyphName]
+                for key, layerName, glyphName in entries
+                if key is fontKey
+            )
+            if glyphs:
+                data[presetName] = glyphs
+        if data:
+            font.lib[linkedGlyphsLibKey] = data
+        elif linkedGlyphsLibKey in font.lib:
+            del font.lib[linkedGlyphsLibKey]
+
+    # Glyphs
+
+    def _glyphEntry(self, glyph):
+        font = glyph.font
+        fontKey = font.naked()
+        if fontKey not in self._fonts:
+            self._fonts[fontKey] = font
+        return (fontKey, glyph.layer.name, glyph.name)
+
+    def link(self, glyph, presetName: str):
+        """
+        Link the image of a glyph to a preset.
+        """
+        self.unlink(glyph, writeFontLib=False)
+        entry = self._glyphEntry(glyph)
+        glyph.lib[linkedPresetLibKey] = presetName
+        self._glyphs.setdefault(presetName, set()).add(entry)
+        self._writeFontLib(entry[0])
+
+    def unlink(self, glyph, writeFontLib=True):
+        """
+        Unlink the image of a glyph from its preset, if any.
+        """
+        presetName = glyph.lib.get(linkedPresetLibKey)
+        if presetName is None:
+            return
+        del glyph.lib[linkedPresetLibKey]
+        entry = self._glyphEntry(glyph)
+        entries = self._glyphs.get(presetName)
+        if entries is not None:
+            entries.discard(entry)
+            if not entries:
+                del self._glyphs[presetName]
+        if writeFontLib:
+            self._writeFontLib(entry[0])
+
+    def getLinkedPresetName(self, glyph):
+        return glyph.lib.get(linkedPresetLibKey)
+
+    def glyphsForPreset(self, presetName: str):
+        """
+        Return a list of the glyphs of open fonts linked to a preset, pruning
+        the links of glyphs that no longer exist or whose lib changed.
+        """
+        glyphs = []
+        stale = []
+        for entry in self._glyphs.get(presetName, ()):
+            fontKey, layerName, glyphName = entry
+            font = self._fonts.get(fontKey)
+            glyph = None
+            if font is not None and layerName in font.layerOrder:
+                layer = font.getLayer(layerName)
+                if glyphName in layer:
+                    glyph = layer[glyphName]
+            if glyph is None or glyph.lib.get(linkedPresetLibKey) != presetName:
+                stale.append(entry)
+            else:
+                glyphs.append(glyph)
+        if stale:
+            entries = self._glyphs[presetName]
+            entries.difference_update(stale)
+            if not entries:
+                del self._glyphs[presetName]
+            for fontKey in {e[0] for e in stale}:
+                self._writeFontLib(fontKey)
+        return glyphs
+
+    # Presets
+
+    def renamePreset(self, oldName: str, newName: str):
+        """
+        Move the links of a renamed preset, only touching the linked glyphs.
+        """
+        glyphs = self.glyphsForPreset(oldName)
+        entries = self._glyphs.pop(oldName, set())
+        if not entries:
+            return
+        for glyph in glyphs:
+            glyph.lib[linkedPresetLibKey] = newName
+        self._glyphs.setdefault(newName, set()).update(entries)
+        for fontKey in {e[0] for e in entries}:
+            self._writeFontLib(fontKey)
+
+    def removePreset(self, presetName: str):
+        """
+        Unlink the glyphs linked to a removed preset, keeping their images as
+        they are.
+        """
+        fontKeys = {e[0] for e in self._glyphs.get(presetName, ())}
+        for glyph in self.glyphsForPreset(presetName):
+            self.unlink(glyph, writeFontLib=False)
+        self._glyphs.pop(presetName, None)
+        for fontKey in fontKeys:
+            self._writeFontLib(fontKey)
+
+    def updateLinkedImages(self, presets):
+        """
+        Apply presets to the images linked to them, in a single pass.
+        Returns:
+            The number of updated images.
+        """
+        count = 0
+        for preset in presets:
+            for glyph in self.glyphsForPreset(preset.name):
+                image = glyph.image
+                if image is None or image.data is None:
+                    self.unlink(glyph)
+                    continue
+                preset.applyToImage(image)
+                count += 1
+        return count
+
+
+linkedPresetsIndex = LinkedPresetsIndex()
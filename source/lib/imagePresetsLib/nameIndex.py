@@ -0,0 +1,65 @@
+import bisect
+
+
+class PresetNameIndex:
+    """
+    A sorted index of preset names, answering case-insensitive prefix queries
+    on the whole names and on each of their words in logarithmic time.
+    """
+
+    def __init__(self, names=()):
+        self._names = set(names)
+        self._keys = sorted(
+            (key, name) for name in self._names for key in self._keysForName(name)
+        )
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    @staticmethod
+    def _keysForName(name):
+        lowerName = name.lower()
+        keys = {lowerName}
+        for i in range(1, len(lowerName)):
+            if lowerName[i].isalnum() and not lowerName[i - 1].isalnum():
+                keys.add(lowerName[i:])
+        return keys
+
+    def add(self, name: str):
+        if name in self._names:
+            return
+        self._names.add(name)
+        for key in self._keysForName(name):
+            bisect.insort(self._keys, (key, name))
+
+    def remove(self, name: str):
+        if name not in self._names:
+            return
+        self._names.remove(name)
+        for key in self._keysForName(name):
+            index = bisect.bisect_left(self._keys, (key, name))
+            if index < len(self._keys) and self._keys[index] == (key, name):
+                del self._keys[index]
+
+    def rename(self, oldName: str, newName: str):
+        self.remove(oldName)
+        self.add(newName)
+
+    def search(self, prefix: str):
+        """
+        Return the set of names whose start, or one of its words' start,
+        matches the prefix.
+        """
+        prefix = prefix.lower()
+        names = set()
+        index = bisect.bisect_left(self._keys, (prefix,))
+        while index < len(self._keys):
+            key, name = self._keys[index]
+            if not key.startswith(prefix):
+                break
+            names.add(name)
+            index += 1
+        return names
@@ -0,0 +1,114 @@
+import collections
+
+import AppKit
+from mojo.extensions import ExtensionBundle
+from Quartz import CIFilter
+
+from .filterGraph import applyFilterDictsToCIImage
+
+
+class PresetThumbnailRenderer:
+    """
+    Render the thumbnails of the presets menus.
+
+    The placeholder image is scaled and clipped once into a source CIImage.
+    Every thumbnail is rendered from it by the same Core Image context and
+    filters, re-parameterized for each preset, and cached per preset version.
+    """
+
+    height = 16
+    cornerRadius = 2
+    # Pixels per point, rendering sharp thumbnails on Retina displays
+    scale = 2
+    cacheSize = 256
+
+    def __init__(self, image=None):
+        self._image = image
+        self._source = None
+        self._size = None
+        self._context = None
+        self._ciFilters = {}
+        self._cache = collections.OrderedDict()
+
+    def _prepare(self):
+        image = self._image
+        if image is None:
+            image = ExtensionBundle("ImagePresets").get("placeholder")
+        width, height = image.size()
+        size = (round(width * self.height / height), self.height)
+        pixelsWide, pixelsHigh = size[0] * self.scale, size[1] * self.scale
+        rep = AppKit.NSBitmapImageRep.alloc().initWithBitmapDataPlanes_pixelsWide_pixelsHigh_bitsPerSample_samplesPerPixel_hasAlpha_isPlanar_colorSpaceName_bytesPerRow_bitsPerPixel_(
+            None,
+            pixelsWide,
+            pixelsHigh,
+            8,
+            4,
+            True,
+            False,
+            AppKit.NSDeviceRGBColorSpace,
+            0,
+            32,
+        )
+        rect = AppKit.NSMakeRect(0, 0, pixelsWide, pixelsHigh)
+        AppKit.NSGraphicsContext.saveGraphicsState()
+        AppKit.NSGraphicsContext.setCurrentContext_(
+            AppKit.NSGraphicsContext.graphicsContextWithBitmapImageRep_(rep)
+        )
+        radius = self.cornerRadius * self.scale
+        AppKit.NSBezierPath.bezierPathWithRoundedRect_xRadius_yRadius_(
+            rect, radius, radius
+        ).addClip()
+        image.drawInRect_fromRect_operation_fraction_(
+            rect, AppKit.NSZeroRect, AppKit.NSCompositingOperationSourceOver, 1.0
+        )
+        AppKit.NSGraphicsContext.restoreGraphicsState()
+        self._source = AppKit.CIImage.alloc().initWithBitmapImageRep_(rep)
+        self._size = size
+        self._context = AppKit.CIContext.contextWithOptions_(None)
+
+    def _applyOpacity(self, ciImage, opacity):
+        ciFilter = self._ciFilters.get("opacity")
+        if ciFilter is None:
+            ciFilter = self._ciFilters["opacity"] = CIFilter.filterWithName_(
+                "CIColorMatrix"
+            )
+            ciFilter.setDefaults()
+        ciFilter.setValue_forKey_(ciImage, "inputImage")
+        ciFilter.setValue_forKey_(
+            AppKit.CIVector.vectorWithX_Y_Z_W_(0, 0, 0, opacity), "inputAVector"
+        )
+        return ciFilter.valueForKey_("outputImage")
+
+    def thumbnailForSnapshot(self, snapshot):
+        """
+        Return the NSImage thumbnail of a preset snapshot.
+        """
+        key = snapshot.key
+        thumbnail = self._cache.get(key)
+        if thumbnail is not None:
+            self._cache.move_to_end(key)
+            return thumbnail
+        if self._source is None:
+            self._prepare()
+        ciImage = applyFilterDictsToCIImage(
+            snapshot.merzFilterDicts, self._source, self._ciFilters
+        )
+        if snapshot.opacity != 1:
+            ciImage = self._applyOpacity(ciImage, snapshot.opacity)
+        cgImage = self._context.createCGImage_fromRect_(ciImage, self._source.extent())
+        thumbnail = AppKit.NSImage.alloc().initWithCGImage_size_(cgImage, self._size)
+        self._cache[key] = thumbnail
+        while len(self._cache) > self.cacheSize:
+            self._cache.popitem(last=False)
+        return thumbnail
+
+    def clear(self):
+        """
+        Forget the cached thumbnails and source image, for instance after
+        changing the placeholder image.
+        """
+        self._source = None
+        self._cache.clear()
+
+
+thumbnailRenderer = PresetThumbnailRenderer()
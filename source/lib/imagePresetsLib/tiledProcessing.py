@@ -0,0 +1,114 @@
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import AppKit
+import numpy
+import Quartz
+
+
+def _bandRanges(height, tileHeight):
+    for top in range(0, height, tileHeight):
+        yield top, min(top + tileHeight, height)
+
+
+def _unpremultiply(band):
+    alpha = band[..., 3:]
+    translucent = (alpha > 0) & (alpha < 255)
+    if translucent.any():
+        rgb = band[..., :3].astype(numpy.float32)
+        unpremultiplied = rgb * 255 / numpy.maximum(alpha, 1) + 0.5
+        band[..., :3] = numpy.where(
+            translucent, numpy.minimum(unpremultiplied, 255), rgb
+        ).astype(numpy.uint8)
+    return band
+
+
+def writeRawImageFile(data, path, tileHeight=512):
+    """
+    Decode image data to a raw (height, width, 4) uint8 RGBA file, without
+    premultiplied alpha.
+
+    The image is decoded a single time, drawn straight into the memory-mapped
+    file, so no full-size pixel array is allocated besides ImageIO's own
+    decoding buffers, which depend on the image format. Alpha is then
+    unpremultiplied in place, band by band.
+    Args:
+        data (bytes or NSData): The encoded image data.
+        path (str): The path of the raw file to write.
+        tileHeight (int): The height of the bands to unpremultiply, in pixels.
+    Returns:
+        The (width, height) of the image.
+    """
+    if not isinstance(data, AppKit.NSData):
+        data = AppKit.NSData.dataWithBytes_length_(data, len(data))
+    source = Quartz.CGImageSourceCreateWithData(data, None)
+    assert source is not None, "Image data can't be decoded"
+    options = {Quartz.kCGImageSourceShouldCache: False}
+    cgImage = Quartz.CGImageSourceCreateImageAtIndex(source, 0, options)
+    width = Quartz.CGImageGetWidth(cgImage)
+    height = Quartz.CGImageGetHeight(cgImage)
+    pixels = numpy.memmap(path, dtype=numpy.uint8, mode="w+", shape=(height, width, 4))
+    # Bitmap contexts store the top row first, like the raw file
+    context = Quartz.CGBitmapContextCreate(
+        pixels,
+        width,
+        height,
+        8,
+        width * 4,
+        Quartz.CGColorSpaceCreateDeviceRGB(),
+        Quartz.kCGImageAlphaPremultipliedLast,
+    )
+    Quartz.CGContextDrawImage(context, Quartz.CGRectMake(0, 0, width, height), cgImage)
+    Quartz.CGContextFlush(context)
+    del context, cgImage
+    for top, bottom in _bandRanges(height, tileHeight):
+        _unpremultiply(pixels[top:bottom])
+    pixels.flush()
+    del pixels
+    return width, height
+
+
+def applyLUTToRawFile(
+    lut,
+    inputPath,
+    outputPath,
+    width,
+    height,
+    tileHeight=256,
+    maxWorkers=None,
+    offset=0,
+):
+    """
+    Apply a `colorLUT.ColorLUT` to a raw (height, width, 4) uint8 RGBA file,
+    without premultiplied alpha, out of core.
+
+    The input file is memory-mapped and processed in bands of `tileHeight`
+    rows by a thread pool. Results are written in order to the output file
+    as soon as they are ready, with at most two bands per worker in flight,
+    so peak memory is bounded by the band size rather than the image size.
+    Args:
+        lut (ColorLUT): The compiled preset.
+        inputPath (str): The path of the raw input file.
+        outputPath (str): The path of the raw output file, in the same format.
+        width (int): The width of the image, in pixels.
+        height (int): The height of the image, in pixels.
+        tileHeight (int): The height of the bands, in pixels.
+        maxWorkers (int, optional): The number of threads, the CPU count if None.
+        offset (int): The position of the pixels in the input file, in bytes.
+    """
+    source = numpy.memmap(
+        inputPath, dtype=numpy.uint8, mode="r", offset=offset, shape=(height, width, 4)
+    )
+    maxWorkers = maxWorkers or os.cpu_count() or 1
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor, open(
+        outputPath, "wb"
+    ) as output:
+        for top, bottom in _bandRanges(height, tileHeight):
+            pending.append(executor.submit(lut.apply, source[top:bottom]))
+            if len(pending) >= 2 * maxWorkers:
+                output.write(pending.popleft().result().data)
+        while pending:
+            output.write(pending.popleft().result().data)
+    del source
@@ -0,0 +1,91 @@
+import collections
+import time
+
+from mojo.events import postEvent
+
+
+class EventTracer:
+    """
+    An opt-in in-memory ring buffer recording the events posted by the
+    extension, to diagnose event storms from the scripting window:
+
+        import imagePresetsLib
+        imagePresetsLib.eventTracer.enable()
+        ...
+        imagePresetsLib.eventTracer.dump()
+    """
+
+    def __init__(self, maxlen=1000):
+        self.enabled = False
+        self._records = collections.deque(maxlen=maxlen)
+
+    def enable(self, maxlen=None):
+        """
+        Start recording events, keeping the last `maxlen` ones.
+        """
+        if maxlen is not None and maxlen != self._records.maxlen:
+            self._records = collections.deque(self._records, maxlen=maxlen)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._records.clear()
+
+    def record(self, eventName, presetNames, timestamp, latency):
+        self._records.append((eventName, presetNames, timestamp, latency))
+
+    def getRecords(self):
+        """
+        Return a list of (eventName, presetNames, timestamp, latency) tuples,
+        the latency being the time spent in the event handlers, in seconds.
+        """
+        return list(self._records)
+
+    def dump(self, limit=None):
+        """
+        Print the recorded events, the `limit` last ones only if given,
+        followed by counts and total latencies per event name.
+        """
+        records = self.getRecords()
+        if limit is not None:
+            records = records[-limit:]
+        if not records:
+            print("No recorded events")
+            return
+        start = records[0][2]
+        totals = collections.defaultdict(lambda: [0, 0])
+        for eventName, presetNames, timestamp, latency in records:
+            print(
+                f"{timestamp - start:10.4f}s  {latency * 1000:8.3f}ms  "
+                f"{eventName}  {', '.join(presetNames)}"
+            )
+            totals[eventName][0] += 1
+            totals[eventName][1] += latency
+        print()
+        for eventName, (count, latency) in sorted(totals.items()):
+            print(f"{eventName}: {count} events, {latency * 1000:.3f}ms")
+
+
+eventTracer = EventTracer()
+
+
+def _presetNames(kwargs):
+    if "preset" in kwargs:
+        return (kwargs["preset"].name,)
+    return tuple(p.name for p in kwargs.get("presets", ()))
+
+
+def postTracedEvent(eventName, lowLevelEventName, **kwargs):
+    """
+    Post an event, recording it in `eventTracer` when enabled.
+    """
+    if not eventTracer.enabled:
+        postEvent(lowLevelEventName, **kwargs)
+        return
+    timestamp = time.time()
+    start = time.perf_counter()
+    postEvent(lowLevelEventName, **kwargs)
+    latency = time.perf_counter() - start
+    eventTracer.record(eventName, _presetNames(kwargs), timestamp, latency)
@@ -1,18 +1,99 @@
+import AppKit
 import imagePresetsLib  # make it available everywhere else
-from mojo.subscriber import Subscriber, registerGlyphEditorSubscriber
+from mojo.extensions import getExtensionDefault, setExtensionDefault
+from mojo.roboFont import AllFonts
+from mojo.UI import getDefault
+from mojo.subscriber import (
+    Subscriber,
+    registerGlyphEditorSubscriber,
+    registerRoboFontSubscriber,
+)
+from mojo.tools import CallbackWrapper
 
 
 manager = imagePresetsLib.ImagePresetsManager
+linkedPresetsIndex = imagePresetsLib.linkedPresetsIndex
+linkDefaultKey = imagePresetsLib.linkAppliedPresetsDefaultKey
 
 if not manager.hasPresets():
     manager.loadFactoryPresets()
 
 
+# Presets sync with other RoboFont instances and scripts
+
+class ImagePresetsSyncSubscriber(Subscriber):
+
+    def roboFontDidBecomeActive(self, info):
+        manager.syncPresets()
+
+
+registerRoboFontSubscriber(ImagePresetsSyncSubscriber)
+
+
+# Images linked to presets
+
+class ImagePresetsLinkSubscriber(Subscriber):
+
+    # Changes posted meanwhile are coalesced in a single update
+    imagePresetsManagerPresetChangedDelay = 0.2
+
+    def build(self):
+        for font in AllFonts():
+            linkedPresetsIndex.addFont(font)
+
+    def fontDocumentDidOpen(self, info):
+        linkedPresetsIndex.addFont(info["font"])
+
+    def fontDocumentWillClose(self, info):
+        linkedPresetsIndex.removeFont(info["font"])
+
+    def imagePresetsManagerPresetChanged(self, info):
+        presets = {}
+        for event in info["lowLevelEvents"]:
+            # The event is also posted for copies and other unregistered
+            # presets, which must not touch the links of the registered ones
+            if not manager.isRegistered(event["preset"]):
+                continue
+            old = dict(event["old"])
+            new = dict(event["new"])
+            oldName = old.pop("name")
+            newName = new.pop("name")
+            if oldName != newName:
+                linkedPresetsIndex.renamePreset(oldName, newName)
+            # Re-applying unchanged values would only add undo entries
+            if old != new:
+                presets[id(event["preset"])] = event["preset"]
+        linkedPresetsIndex.updateLinkedImages(presets.values())
+
+    def imagePresetsManagerDidRemovePreset(self, info):
+        linkedPresetsIndex.removePreset(info["preset"].name)
+
+    def imagePresetsManagerDidRemovePresets(self, info):
+        for preset in info["presets"]:
+            linkedPresetsIndex.removePreset(preset.name)
+
+
+registerRoboFontSubscriber(ImagePresetsLinkSubscriber)
+
+
 # Glyph Editor contextual submenus
 
 class ImagePresetsMenuSubscriber(Subscriber):
 
-    debug = True
+    def build(self):
+        self.linkTarget = CallbackWrapper(self.toggleLinkPresets)
+        # Highlighted presets are previewed on a copy of the glyph image,
+        # drawn over it but below the contours, without changing the glyph
+        self.previewContainer = self.getGlyphEditor().extensionContainer(
+            identifier="com.adbac.ImagePresets.preview",
+            location="background",
+            clear=True,
+        )
+        self.previewLayer = None
+        self.previewImageLayer = None
+
+    def destroy(self):
+        self.previewContainer.clearSublayers()
 
     def glyphEditorWantsImageContextualMenuItems(self, info):
         self.addMenuItems(info)
@@ -21,25 +102,90 @@ class ImagePresetsMenuSubscriber(Subscriber):
         self.addMenuItems(info)
 
     def addMenuItems(self, info):
-        presets = manager.presets
-        if not presets:
+        if not manager.presets:
             return
-        menuItems = [
-            (
-                "Apply Image Preset",
-                imagePresetsLib.ImagePresetsManager.makeMenuItems(
-                    includeNone=False,
-                    callback=self.applyPreset,
-                ),
-            )
-        ]
-        info["itemDescriptions"].extend(menuItems)
+        self.clearPreview()
+        # The presets submenu is populated when it is about to be shown
+        menuItem = manager.makeLazyMenuItem(
+            "Apply Image Preset",
+            callback=self.applyPreset,
+            previewCallback=self.previewPreset,
+        )
+        info["itemDescriptions"].append(menuItem)
+        linkItem = AppKit.NSMenuItem.alloc().initWithTitle_action_keyEquivalent_(
+            "Link Applied Image Presets", "action:", ""
+        )
+        linkItem.setTarget_(self.linkTarget)
+        linkItem.setState_(
+            AppKit.NSControlStateValueOn
+            if getExtensionDefault(linkDefaultKey, fallback=False)
+            else AppKit.NSControlStateValueOff
+        )
+        info["itemDescriptions"].append(linkItem)
+
+    def toggleLinkPresets(self, sender):
+        setExtensionDefault(
+            linkDefaultKey, not getExtensionDefault(linkDefaultKey, fallback=False)
+        )
+
+    def clearPreview(self):
+        self.previewContainer.clearSublayers()
+        self.previewLayer = None
+        self.previewImageLayer = None
+
+    def makePreviewLayer(self):
+        image = self.getGlyphEditor().getGlyph().image
+        if image is None or image.data is None:
+            return None
+        rep = AppKit.NSBitmapImageRep.imageRepWithData_(image.data)
+        if rep is None:
+            return None
+        size = (rep.pixelsWide(), rep.pixelsHigh())
+        nsImage = AppKit.NSImage.alloc().initWithSize_(size)
+        nsImage.addRepresentation_(rep)
+        layer = self.previewContainer.appendBaseSublayer(
+            position=(0, 0),
+            size=size,
+            visible=False,
+        )
+        layer.addTransformation(image.transformation)
+        # An opaque base hides the original image, so that translucent
+        # presets show over the view background as they will once applied
+        layer.appendRectangleSublayer(
+            position=(0, 0),
+            size=size,
+            fillColor=getDefault("glyphViewBackgroundColor", (1, 1, 1, 1)),
+        )
+        self.previewImageLayer = layer.appendImageSublayer(
+            position=(0, 0),
+            size=size,
+            image=nsImage,
+        )
+        return layer
+
+    def previewPreset(self, preset):
+        if preset is None:
+            if self.previewLayer is not None:
+                self.previewLayer.setVisible(False)
+            return
+        if self.previewLayer is None:
+            # Made once per menu, on the first highlighted preset
+            self.previewLayer = self.makePreviewLayer()
+            if self.previewLayer is None:
+                return
+        with self.previewLayer.propertyGroup():
+            preset.applyToMerzLayer(self.previewImageLayer, overwriteFilters=True)
+            self.previewLayer.setVisible(True)
 
     def applyPreset(self, sender):
-        if not manager.presets:
+        self.clearPreview()
+        preset = sender.representedObject()
+        if preset is None:
             return
-        preset = manager.getPresetByName(sender.title())
-        preset.applyToImage(self.getGlyphEditor().getGlyph().image)
+        preset.applyToImage(
+            self.getGlyphEditor().getGlyph().image,
+            link=getExtensionDefault(linkDefaultKey, fallback=False),
+        )
 
 
 registerGlyphEditorSubscriber(ImagePresetsMenuSubscriber)
@@ -0,0 +1,196 @@
+import AppKit
+import ezui
+from imagePresetsLib import ImagePresetsManager
+from mojo.subscriber import Subscriber, registerRoboFontSubscriber
+
+
+class ImagePresetsComparisonController(Subscriber, ezui.WindowController):
+    """
+    A grid showing an image under several presets side by side.
+
+    All cells share one downsampled copy of the image. Only the cells of the
+    current page exist as Merz layers, and a cell is only re-rendered when
+    its preset or its preset's version changes.
+
+    Open it with `openWindow`, each window being a subscriber of its own.
+    """
+
+    sourceImage = None
+    presetNames = None
+
+    columns = 4
+    rows = 3
+    cellWidth = 180
+    titleHeight = 22
+    margin = 10
+
+    @classmethod
+    def openWindow(cls, image, presetNames=None):
+        """
+        Open a comparison window.
+        Args:
+            image (NSImage): The image to compare the presets on.
+            presetNames (list, optional): The names of the compared presets,
+                all the registered presets if None.
+        """
+        # Subscribers are registered by class, so each window gets a
+        # subclass holding its arguments
+        windowClass = type(
+            cls.__name__,
+            (cls,),
+            dict(sourceImage=image, presetNames=presetNames),
+        )
+        registerRoboFontSubscriber(windowClass)
+
+    def build(self):
+        self.page = 0
+
+        image = self.sourceImage
+        width, height = image.size()
+        self.imageHeight = round(self.cellWidth * height / width)
+        self.cellHeight = self.imageHeight + self.titleHeight
+        viewWidth = self.columns * (self.cellWidth + self.margin) + self.margin
+        viewHeight = self.rows * (self.cellHeight + self.margin) + self.margin
+
+        content = """
+        * MerzView              @grid
+        ---
+        (<)                     @previousPageButton
+        Page                    @pageLabel
+        (>)                     @nextPageButton
+        """
+        descriptionData = dict(
+            grid=dict(
+                width=viewWidth,
+                height=viewHeight,
+                backgroundColor=(1, 1, 1, 1),
+            ),
+        )
+        self.w = ezui.EZWindow(
+            title="Image Presets Comparison",
+            size=("auto", "auto"),
+            content=content,
+            descriptionData=descriptionData,
+            controller=self,
+        )
+
+        self.sharedImage = self.makeSharedImage(image)
+
+        # Pool of page cells, each one an image and a title layer
+        container = self.w.getItem("grid").getMerzContainer()
+        self.cells = []
+        for index in range(self.columns * self.rows):
+            column = index % self.columns
+            row = index // self.columns
+            x = self.margin + column * (self.cellWidth + self.margin)
+            y = viewHeight - (row + 1) * (self.cellHeight + self.margin)
+            imageLayer = container.appendImageSublayer(
+                position=(x, y + self.titleHeight),
+                size=(self.cellWidth, self.imageHeight),
+                image=self.sharedImage,
+                visible=False,
+            )
+            titleLayer = container.appendTextLineSublayer(
+                position=(x + self.cellWidth / 2, y + self.titleHeight / 2),
+                pointSize=11,
+                fillColor=(0, 0, 0, 1),
+                horizontalAlignment="center",
+                verticalAlignment="center",
+                visible=False,
+            )
+            # (preset, snapshot key) rendered by the cell
+            self.cells.append([imageLayer, titleLayer, None, None])
+
+        self.updatePage()
+
+    def started(self):
+        self.w.open()
+
+    def makeSharedImage(self, image):
+        # Downsample the image once for all the cells
+        width, height = self.cellWidth * 2, self.imageHeight * 2
+        sharedImage = AppKit.NSImage.alloc().initWithSize_((width, height))
+        sharedImage.lockFocus()
+        AppKit.NSGraphicsContext.currentContext().setImageInterpolation_(
+            AppKit.NSImageInterpolationHigh
+        )
+        image.drawInRect_fromRect_operation_fraction_(
+            AppKit.NSMakeRect(0, 0, width, height),
+            AppKit.NSZeroRect,
+            AppKit.NSCompositingOperationSourceOver,
+            1.0,
+        )
+        sharedImage.unlockFocus()
+        return sharedImage
+
+    def getPresets(self):
+        presets = ImagePresetsManager.getPresets()
+        if self.presetNames is None:
+            return presets
+        names = set(self.presetNames)
+        return tuple(p for p in presets if p.name in names)
+
+    def renderCell(self, cell, preset):
+        imageLayer, titleLayer, renderedPreset, renderedKey = cell
+        if preset is None:
+            imageLayer.setVisible(False)
+            titleLayer.setVisible(False)
+            cell[2:] = [None, None]
+            return
+        snapshot = preset.snapshot()
+        if preset is renderedPreset and snapshot.key == renderedKey:
+            return
+        with imageLayer.propertyGroup():
+            preset.applyToMerzLayer(imageLayer, overwriteFilters=True)
+            imageLayer.setVisible(True)
+        titleLayer.setText(snapshot.name)
+        titleLayer.setVisible(True)
+        cell[2:] = [preset, snapshot.key]
+
+    def updatePage(self):
+        presets = self.getPresets()
+        pageSize = len(self.cells)
+        pageCount = max(1, -(-len(presets) // pageSize))
+        self.page = min(self.page, pageCount - 1)
+        pagePresets = presets[self.page * pageSize : (self.page + 1) * pageSize]
+        for index, cell in enumerate(self.cells):
+            self.renderCell(cell, pagePresets[index] if index < len(pagePresets) else None)
+        self.w.getItem("pageLabel").set(f"Page {self.page + 1} of {pageCount}")
+        self.w.getItem("previousPageButton").enable(self.page > 0)
+        self.w.getItem("nextPageButton").enable(self.page < pageCount - 1)
+
+    def previousPageButtonCallback(self, sender):
+        self.page -= 1
+        self.updatePage()
+
+    def nextPageButtonCallback(self, sender):
+        self.page += 1
+        self.updatePage()
+
+    # Manager events
+
+    def imagePresetsManagerPresetChanged(self, info):
+        preset = info["preset"]
+        # The event is also posted for copies and other unregistered presets
+        if not ImagePresetsManager.isRegistered(preset):
+            return
+        if self.presetNames is not None and info["old"]["name"] != info["new"]["name"]:
+            # A renamed preset may enter or leave the compared subset
+            self.updatePage()
+            return
+        for cell in self.cells:
+            if cell[2] is preset:
+                self.renderCell(cell, preset)
+                return
+
+    def imagePresetsManagerDidAddPreset(self, info):
+        self.updatePage()
+
+    def imagePresetsManagerDidAddPresets(self, info):
+        self.updatePage()
+
+    def imagePresetsManagerDidRemovePreset(self, info):
+        self.updatePage()
+
+    def imagePresetsManagerDidRemovePresets(self, info):
+        self.updatePage()
@@ -1,9 +1,16 @@
 import ezui
-from imagePresetsLib import ImagePreset, ImagePresetsManager, RGBAColor
+from imagePresetsLib import (
+    ImagePreset,
+    ImagePresetsManager,
+    PresetNameIndex,
+    RGBAColor,
+)
 from mojo.extensions import ExtensionBundle
+from mojo.subscriber import Subscriber, registerRoboFontSubscriber
+from presetsComparisonWindow import ImagePresetsComparisonController
 
 
-class ImagePresetsController(ezui.WindowController):
+class ImagePresetsController(Subscriber, ezui.WindowController):
 
     def build(self):
 
@@ -12,10 +19,13 @@ class ImagePresetsController(ezui.WindowController):
         content = """
         = HorizontalStack
 
-        |-----------------------------| @presetsList
-        |                             |
-        |-----------------------------|
-        > (+-)    @presetsListAddRemoveButton
+        * VerticalStack         @presetsVStack
+        > [__]                  @presetsSearch
+        > |-----------------------------| @presetsList
+        > |                             |
+        > |-----------------------------|
+        >> (+-)    @presetsListAddRemoveButton
+        > (Compare…)            @compareButton
 
         * VerticalStack         @settingsVStack
         > Name: [__]            @presetName
@@ -53,12 +63,24 @@ class ImagePresetsController(ezui.WindowController):
             self.filterDefaults["color"].alphaRange.default,
         )
 
+        # Names of the presets shown in the list, in the manager's order,
+        # filtered by the search field
+        presets = ImagePresetsManager.getPresets()
+        self.searchText = ""
+        self.presetNameIndex = PresetNameIndex(p.name for p in presets)
+        self.displayedNames = [p.name for p in presets]
+        self.shownPresetDict = None
+        self.editingPreset = False
+
         descriptionData=dict(
+            presetsSearch=dict(
+                width=175,
+                placeholder="Search",
+                continuous=True,
+            ),
             presetsList=dict(
                 width=175,
-                items=[
-                    dict(presetName=p.name) for p in ImagePresetsManager.presets
-                ],
+                items=[dict(presetName=name) for name in self.displayedNames],
                 columnDescriptions=[dict(
                     identifier="presetName",
                 )],
@@ -149,6 +171,7 @@ class ImagePresetsController(ezui.WindowController):
         scale = 280 / imHeight
         image.setSize_((imWidth * scale, imHeight * scale))
         self.imageLayer.setImage(image)
+        self.previewImage = image
 
         self.presetsListSelectionCallback(self.w.getItem("presetsList"))
 
@@ -167,20 +190,28 @@ class ImagePresetsController(ezui.WindowController):
         else:
             currentPreset.applyToMerzLayer(self.imageLayer, overwriteFilters=True)
 
+    def setCurrentPresetValue(self, attr, value):
+        self.editingPreset = True
+        try:
+            setattr(self.currentPreset, attr, value)
+        finally:
+            self.editingPreset = False
+        self.shownPresetDict = self.currentPreset.asDict()
+
     def brightnessCallback(self, sender):
-        self.currentPreset.brightness = sender.get()
+        self.setCurrentPresetValue("brightness", sender.get())
         self.updateFiltersPreview()
 
     def contrastCallback(self, sender):
-        self.currentPreset.contrast = sender.get()
+        self.setCurrentPresetValue("contrast", sender.get())
         self.updateFiltersPreview()
 
     def saturationCallback(self, sender):
-        self.currentPreset.saturation = sender.get()
+        self.setCurrentPresetValue("saturation", sender.get())
         self.updateFiltersPreview()
 
     def sharpnessCallback(self, sender):
-        self.currentPreset.sharpness = sender.get()
+        self.setCurrentPresetValue("sharpness", sender.get())
         self.updateFiltersPreview()
 
     def useFalseColorCallback(self, sender):
@@ -188,11 +219,11 @@ class ImagePresetsController(ezui.WindowController):
         if sender.get():
             self.colorCallback(self.w.getItem("color"))
         else:
-            self.currentPreset.color = None
+            self.setCurrentPresetValue("color", None)
         self.updateFiltersPreview()
 
     def colorCallback(self, sender):
-        self.currentPreset.color = RGBAColor(*sender.get()).denormalized()
+        self.setCurrentPresetValue("color", RGBAColor(*sender.get()).denormalized())
         self.updateFiltersPreview()
 
     def showOriginalCallback(self, sender):
@@ -225,23 +256,132 @@ class ImagePresetsController(ezui.WindowController):
         if preset.color is not None:
             self.w.getItem("useFalseColor").set(True)
         self.w.getItem("presetName").set(preset.name)
+        self.shownPresetDict = None if currentPresetIsNone else preset.asDict()
         if currentPresetIsNone:
             self.setUIFieldsState(False)
         else:
             self.setUIFieldsState(True)
             self.useFalseColorCallback(self.w.getItem("useFalseColor"))
 
-    def presetsListAddRemoveButtonAddCallback(self, sender):
+    # Presets list
+
+    def filterDisplayedNames(self, names):
+        if not self.searchText:
+            return list(names)
+        matches = self.presetNameIndex.search(self.searchText)
+        return [name for name in names if name in matches]
+
+    def selectPresetName(self, name):
+        table = self.w.getItem("presetsList")
+        if name in self.displayedNames:
+            table.setSelectedIndexes([self.displayedNames.index(name)])
+        else:
+            table.setSelectedIndexes([])
+
+    def presetsAdded(self, presets):
+        # Presets are added at the end of the manager's list
+        table = self.w.getItem("presetsList")
+        names = [p.name for p in presets if p.name not in self.presetNameIndex]
+        for name in names:
+            self.presetNameIndex.add(name)
+        names = self.filterDisplayedNames(names)
+        if names:
+            self.displayedNames.extend(names)
+            table.appendItems([dict(presetName=name) for name in names])
+
+    def presetsRemoved(self, presets):
+        table = self.w.getItem("presetsList")
+        names = {p.name for p in presets if p.name in self.presetNameIndex}
+        for name in names:
+            self.presetNameIndex.remove(name)
+        indexes = [i for i, name in enumerate(self.displayedNames) if name in names]
+        if indexes:
+            for index in reversed(indexes):
+                del self.displayedNames[index]
+            table.removeIndexes(indexes)
+        if self.currentPreset in presets:
+            self.currentPreset = None
+            self.forceUpdateUIFields()
+            self.updateFiltersPreview()
+
+    def presetRenamed(self, oldName, newName):
+        if oldName == newName or oldName not in self.presetNameIndex:
+            return
         table = self.w.getItem("presetsList")
+        self.presetNameIndex.rename(oldName, newName)
+        shown = bool(self.filterDisplayedNames([newName]))
+        if oldName in self.displayedNames:
+            index = self.displayedNames.index(oldName)
+            if shown:
+                self.displayedNames[index] = newName
+                table.setItem(index, dict(presetName=newName))
+            else:
+                del self.displayedNames[index]
+                table.removeIndexes([index])
+        elif shown:
+            # Keep the manager's order
+            positions = {p.name: i for i, p in enumerate(ImagePresetsManager.presets)}
+            position = positions[newName]
+            index = 0
+            while (
+                index < len(self.displayedNames)
+                and positions.get(self.displayedNames[index], -1) < position
+            ):
+                index += 1
+            self.displayedNames.insert(index, newName)
+            table.insertItems(index, [dict(presetName=newName)])
+
+    def presetsSearchCallback(self, sender):
+        self.searchText = sender.get().strip()
+        displayedNames = self.filterDisplayedNames(
+            p.name for p in ImagePresetsManager.getPresets()
+        )
+        if displayedNames == self.displayedNames:
+            return
+        self.displayedNames = displayedNames
+        table = self.w.getItem("presetsList")
+        table.set([dict(presetName=name) for name in displayedNames])
+        if self.currentPreset is not None:
+            self.selectPresetName(self.currentPreset.name)
+
+    # Manager events
+
+    def imagePresetsManagerDidAddPreset(self, info):
+        self.presetsAdded([info["preset"]])
+
+    def imagePresetsManagerDidAddPresets(self, info):
+        self.presetsAdded(info["presets"])
+
+    def imagePresetsManagerDidRemovePreset(self, info):
+        self.presetsRemoved([info["preset"]])
+
+    def imagePresetsManagerDidRemovePresets(self, info):
+        self.presetsRemoved(info["presets"])
+
+    def imagePresetsManagerPresetChanged(self, info):
+        preset = info["preset"]
+        # The event is also posted for copies and other unregistered presets
+        if not ImagePresetsManager.isRegistered(preset):
+            return
+        self.presetRenamed(info["old"]["name"], info["new"]["name"])
+        if preset is self.currentPreset and not self.editingPreset:
+            if preset.asDict() != self.shownPresetDict:
+                self.forceUpdateUIFields()
+                self.updateFiltersPreview()
+
+    def presetsListAddRemoveButtonAddCallback(self, sender):
         name = "New Preset"
         baseName = name
         counter = 1
-        while name in (p.name for p in ImagePresetsManager.presets):
+        while ImagePresetsManager.hasPresetName(name):
             name = f"{baseName} {counter}"
             counter += 1
-        table.appendItems([dict(presetName=name)])
         newPreset = ImagePreset(name=name, saveToDefaults=True)
-        table.setSelectedIndexes([len(ImagePresetsManager.presets) - 1,])
+        self.presetsAdded([newPreset])
+        if name not in self.displayedNames:
+            self.w.getItem("presetsSearch").set("")
+            self.presetsSearchCallback(self.w.getItem("presetsSearch"))
+        self.selectPresetName(name)
 
     def presetsListAddRemoveButtonRemoveCallback(self, sender):
         table = self.w.getItem("presetsList")
@@ -250,15 +390,20 @@ class ImagePresetsController(ezui.WindowController):
             return
         else:
             index = selectedIndex[0]
-        ImagePresetsManager.removePresetByName(self.currentPreset.name)
-        presets = ImagePresetsManager.presets
-        table.removeSelectedItems()
-        if presets:
-            table.setSelectedIndexes([index,] if index < len(presets) else [index - 1,])
+        preset = self.currentPreset
+        ImagePresetsManager.removePreset(preset)
+        self.presetsRemoved([preset])
+        if self.displayedNames:
+            table.setSelectedIndexes([min(index, len(self.displayedNames) - 1)])
         else:
             self.currentPreset = None
         self.forceUpdateUIFields()
 
+    def compareButtonCallback(self, sender):
+        # Compare the presets shown in the list
+        presetNames = list(self.displayedNames) if self.searchText else None
+        ImagePresetsComparisonController.openWindow(self.previewImage, presetNames)
+
     def presetsListSelectionCallback(self, sender):
         if not self.initialized:
             return
@@ -273,18 +418,18 @@ class ImagePresetsController(ezui.WindowController):
 
     def presetNameCallback(self, sender):
         newName = sender.get()
-        if ImagePresetsManager.hasPresetName(newName) and newName != self.currentPreset.name:
+        oldName = self.currentPreset.name
+        if ImagePresetsManager.hasPresetName(newName) and newName != oldName:
             self.showMessage(
                 messageText="This name is already used by another preset",
                 alertStyle="informational",
                 icon=self.extensionBundle.get("icon"),
             )
-            sender.set(self.currentPreset.name)
+            sender.set(oldName)
             return
-        self.currentPreset.name = newName
-        table = self.w.getItem("presetsList")
-        index = table.getSelectedIndexes()[0]
-        table.setItem(index, dict(presetName=newName))
-        table.setSelectedIndexes([index,])
+        self.setCurrentPresetValue("name", newName)
+        self.presetRenamed(oldName, newName)
+        self.selectPresetName(newName)
+
 
-ImagePresetsController()
+registerRoboFontSubscriber(ImagePresetsController)
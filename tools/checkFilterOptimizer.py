@@ -0,0 +1,54 @@
+"""
+Check that the filter chain optimizer keeps the order of the filters of a
+set of presets, including sharpened false color presets whose dark color
+isn't gray, for which sharpening and false color don't commute.
+
+Outside of RoboFont this runs with the stubs of `replayPresetsController`,
+which can't render, so only the filter order is checked:
+
+    python tools/checkFilterOptimizer.py
+
+In RoboFont, the same presets can also be rendered and compared with
+`preset.asMerzFilterDicts(verify=True)` from the scripting window.
+"""
+
+import os
+import sys
+
+import replayPresetsController
+
+checkedPresets = [
+    dict(name="Sharpened red", sharpness=80, color=(255, 0, 0, 100)),
+    dict(name="Sharpened gray", sharpness=80, color=(128, 128, 128, 100)),
+    dict(name="Sharpened blue, contrast", sharpness=150, contrast=200, color=(0, 0, 255, 40)),
+    dict(name="Sharpened", sharpness=80, brightness=20),
+    dict(name="Red", color=(255, 0, 0, 100)),
+    dict(name="Identity"),
+]
+
+
+def main():
+    replayPresetsController.installStubs()
+    libFolder = replayPresetsController.libFolder
+    sys.path[:0] = [libFolder, os.path.join(libFolder, "imagePresetsLib")]
+    from imagePresetsLib import ImagePreset
+    from imagePresetsLib.filterGraph import verifyFilterOrder
+
+    failures = 0
+    for values in checkedPresets:
+        preset = ImagePreset(**values)
+        original = preset.asMerzFilterDicts(optimize=False)
+        optimized = [dict(fd) for fd in preset.snapshot().merzFilterDicts]
+        try:
+            verifyFilterOrder(original, optimized)
+        except AssertionError as error:
+            failures += 1
+            print(f"FAILED {preset.name}: {error}")
+        else:
+            print(f"OK {preset.name}: {[fd['filterType'] for fd in optimized]}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
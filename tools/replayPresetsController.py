@@ -0,0 +1,410 @@
+"""
+Replay interaction sequences against the Image Presets window, outside of
+RoboFont, and report the latency of each callback along with the number of
+saves, events and filter rebuilds they caused.
+
+The RoboFont, ezui, Merz and Cocoa modules are replaced with in-memory stubs,
+so this runs anywhere (including Linux) and measures the controller and
+manager logic only, not the rendering:
+
+    python tools/replayPresetsController.py
+    python tools/replayPresetsController.py --steps 300 --cycles 500
+    python tools/replayPresetsController.py --sequence recorded.json
+
+A recorded sequence is a JSON list of steps, each one a dict with the
+identifier of the window "item", the "callback" of the controller to call
+(by default "<item>Callback") and the "value" to set on the item first, if
+any.
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import sys
+import time
+import types
+
+libFolder = os.path.join(os.path.dirname(__file__), "..", "source", "lib")
+
+
+# Counters
+
+counters = collections.Counter()
+
+
+# Stubs
+
+
+class _Stub:
+    """
+    Accepts any attribute access or call, for the Cocoa APIs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return _Stub()
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+    def __iter__(self):
+        return iter(())
+
+    @classmethod
+    def alloc(cls):
+        return cls()
+
+    def init(self):
+        return self
+
+
+def _stubModule(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    module.__getattr__ = lambda attribute: _Stub()
+    sys.modules[name] = module
+    return module
+
+
+class StubImage(_Stub):
+    def __init__(self, width=400, height=280):
+        self._size = (width, height)
+
+    def size(self):
+        return self._size
+
+    def setSize_(self, size):
+        self._size = tuple(size)
+
+
+class StubLayer:
+    def __init__(self, **kwargs):
+        self.filters = []
+        self.properties = dict(kwargs)
+
+    def setFilters(self, filters):
+        counters["filterRebuilds"] += 1
+        self.filters = list(filters)
+
+    def clearFilters(self):
+        self.setFilters([])
+
+    def appendFilter(self, filterDict):
+        counters["filterAppends"] += 1
+        self.filters.append(filterDict)
+
+    def propertyGroup(self):
+        return _nullContext()
+
+    def __getattr__(self, name):
+        # setOpacity, setImage, setVisible...
+        if name.startswith("set"):
+            key = name[3].lower() + name[4:]
+            return lambda value: self.properties.__setitem__(key, value)
+        raise AttributeError(name)
+
+
+class _nullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class StubMerzContainer:
+    def __init__(self):
+        self.sublayers = []
+
+    def _appendSublayer(self, **kwargs):
+        layer = StubLayer(**kwargs)
+        self.sublayers.append(layer)
+        return layer
+
+    appendImageSublayer = _appendSublayer
+    appendBaseSublayer = _appendSublayer
+    appendTextLineSublayer = _appendSublayer
+
+
+class StubItem:
+    """
+    A window item, standing for text fields, sliders, checkboxes, color
+    wells, tables and Merz views alike.
+    """
+
+    def __init__(self, identifier, controller, description):
+        self.identifier = identifier
+        self.controller = controller
+        self.value = description.get("value", description.get("color"))
+        self.isTable = "items" in description
+        self.items = list(description.get("items", ()))
+        self.selection = []
+        self.enabled = True
+        self.merzContainer = StubMerzContainer()
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        if self.isTable:
+            self.items = list(value)
+            self.selection = [i for i in self.selection if i < len(self.items)]
+        else:
+            self.value = value
+
+    def enable(self, state):
+        self.enabled = state
+
+    def getMerzContainer(self):
+        return self.merzContainer
+
+    # Tables
+
+    def appendItems(self, items):
+        self.items.extend(items)
+
+    def insertItems(self, index, items):
+        self.items[index:index] = items
+
+    def setItem(self, index, item):
+        self.items[index] = item
+
+    def removeIndexes(self, indexes):
+        for index in sorted(indexes, reverse=True):
+            del self.items[index]
+        self.setSelectedIndexes([])
+
+    def getSelectedIndexes(self):
+        return list(self.selection)
+
+    def getSelectedItems(self):
+        return [self.items[i] for i in self.selection]
+
+    def setSelectedIndexes(self, indexes):
+        indexes = list(indexes)
+        if indexes == self.selection:
+            return
+        self.selection = indexes
+        callback = getattr(self.controller, f"{self.identifier}SelectionCallback", None)
+        if callback is not None:
+            callback(self)
+
+
+class StubWindow:
+    def __init__(self, content="", descriptionData=None, controller=None, **kwargs):
+        descriptionData = descriptionData or {}
+        self.items = {
+            identifier: StubItem(
+                identifier, controller, descriptionData.get(identifier, {})
+            )
+            for identifier in re.findall(r"@(\w+)", content)
+        }
+
+    def getItem(self, identifier):
+        return self.items[identifier]
+
+    def open(self):
+        pass
+
+
+class StubSubscriber:
+    pass
+
+
+class StubWindowController:
+    def __init__(self, *args, **kwargs):
+        self.build(*args, **kwargs)
+        self.started()
+
+    def started(self):
+        pass
+
+    def showMessage(self, *args, **kwargs):
+        pass
+
+
+# Events are delivered synchronously to the replayed controllers, like the
+# subscriber events they stand for
+eventTargets = []
+
+
+def postEvent(lowLevelEventName, **kwargs):
+    counters["events"] += 1
+    eventName = lowLevelEventName.rsplit(".", 1)[-1]
+    for target in eventTargets:
+        method = getattr(target, eventName, None)
+        if method is not None:
+            info = dict(kwargs, lowLevelEvents=[kwargs])
+            method(info)
+
+
+extensionDefaults = {}
+
+
+def getExtensionDefault(key, fallback=None):
+    return extensionDefaults.get(key, fallback)
+
+
+def setExtensionDefault(key, value):
+    # Count the writes of the presets, not of their revision
+    if key.endswith(".presets"):
+        counters["saves"] += 1
+    extensionDefaults[key] = value
+
+
+class StubExtensionBundle:
+    def __init__(self, name):
+        pass
+
+    def get(self, name):
+        return StubImage()
+
+
+def installStubs():
+    _stubModule("objc")
+    _stubModule("AppKit", NSObject=_Stub)
+    _stubModule("Quartz", CIFilter=_Stub())
+    mojo = _stubModule("mojo")
+    mojo.__path__ = []
+    _stubModule(
+        "mojo.events",
+        postEvent=postEvent,
+        addObserver=lambda *args: None,
+        removeObserver=lambda *args: None,
+    )
+    _stubModule(
+        "mojo.extensions",
+        ExtensionBundle=StubExtensionBundle,
+        getExtensionDefault=getExtensionDefault,
+        setExtensionDefault=setExtensionDefault,
+    )
+    _stubModule(
+        "mojo.subscriber",
+        Subscriber=StubSubscriber,
+        registerSubscriberEvent=lambda **kwargs: None,
+        registerRoboFontSubscriber=lambda subscriber: None,
+        registerGlyphEditorSubscriber=lambda subscriber: None,
+    )
+    _stubModule("mojo.tools", CallbackWrapper=_Stub)
+    _stubModule("mojo.roboFont", AllFonts=lambda: [])
+    _stubModule("ezui", EZWindow=StubWindow, WindowController=StubWindowController)
+
+
+# Sequences
+
+
+def brightnessDragSequence(steps=300):
+    """
+    Drag the brightness slider from its minimum to its maximum.
+    """
+    return [
+        dict(item="brightness", value=round(-100 + 200 * i / max(steps - 1, 1)))
+        for i in range(steps)
+    ]
+
+
+def addRenameRemoveSequence(cycles=500):
+    """
+    Add a preset, rename it and remove it, again and again.
+    """
+    sequence = []
+    for i in range(cycles):
+        sequence.extend(
+            [
+                dict(
+                    item="presetsListAddRemoveButton",
+                    callback="presetsListAddRemoveButtonAddCallback",
+                ),
+                dict(item="presetName", value=f"Replayed Preset {i}"),
+                dict(
+                    item="presetsListAddRemoveButton",
+                    callback="presetsListAddRemoveButtonRemoveCallback",
+                ),
+            ]
+        )
+    return sequence
+
+
+def replay(controller, sequence):
+    """
+    Replay a sequence of steps on a controller.
+    Returns:
+        A dict of lists of latencies in seconds, by callback name.
+    """
+    latencies = collections.defaultdict(list)
+    for step in sequence:
+        item = controller.w.getItem(step["item"])
+        callbackName = step.get("callback", f"{step['item']}Callback")
+        callback = getattr(controller, callbackName)
+        start = time.perf_counter()
+        if "value" in step:
+            item.set(step["value"])
+        callback(item)
+        latencies[callbackName].append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def report(title, latencies, counts):
+    print(title)
+    for callbackName, values in latencies.items():
+        print(
+            f"  {callbackName}: {len(values)} calls, "
+            + ", ".join(
+                f"p{p} {percentile(values, p) * 1000:.3f}ms" for p in (50, 90, 99)
+            )
+            + f", max {max(values) * 1000:.3f}ms"
+        )
+    print(
+        f"  saves: {counts['saves']}, events: {counts['events']}, "
+        f"filter rebuilds: {counts['filterRebuilds']} "
+        f"({counts['filterAppends']} filters appended)"
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=300, help="brightness drag steps")
+    parser.add_argument("--cycles", type=int, default=500, help="add/rename/remove cycles")
+    parser.add_argument("--sequence", help="a recorded JSON sequence to replay instead")
+    options = parser.parse_args(args)
+
+    installStubs()
+    sys.path[:0] = [libFolder, os.path.join(libFolder, "imagePresetsLib")]
+    from imagePresetsLib import ImagePresetsManager
+    from presetsWindow import ImagePresetsController
+
+    ImagePresetsManager.loadFactoryPresets()
+    controller = ImagePresetsController()
+    eventTargets.append(controller)
+
+    if options.sequence:
+        with open(options.sequence) as f:
+            sequences = [(options.sequence, json.load(f))]
+    else:
+        sequences = [
+            (f"Brightness drag ({options.steps} steps)", brightnessDragSequence(options.steps)),
+            (
+                f"Add/rename/remove ({options.cycles} cycles)",
+                addRenameRemoveSequence(options.cycles),
+            ),
+        ]
+    for title, sequence in sequences:
+        # Start each sequence from the first preset
+        controller.w.getItem("presetsList").setSelectedIndexes([0])
+        counters.clear()
+        latencies = replay(controller, sequence)
+        report(title, latencies, counters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Hammer `ImagePresetsManager` with concurrent writer and reader threads,
+outside of RoboFont, using the stubs of `replayPresetsController`:
+
+    python tools/stressPresetsManager.py
+    python tools/stressPresetsManager.py --writers 4 --readers 4 --iterations 500
+
+Writers add, rename, update and remove presets one by one and in batches.
+Readers check that every list of presets they get has unique names, and
+that every snapshot is consistent: its hash matches its values, and the
+brightness and contrast that writers always set together match.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import threading
+
+import replayPresetsController
+
+
+def _snapshotHash(snapshot, attrs):
+    return hashlib.sha1(
+        repr(tuple(getattr(snapshot, attr) for attr in attrs)).encode("utf-8")
+    ).hexdigest()
+
+
+def stress(writers=4, readers=4, iterations=300, batchSize=5):
+    """
+    Run the writer and reader threads.
+    Returns:
+        A list of error messages, empty if the manager stayed consistent.
+    """
+    from imagePresetsLib import ImagePreset, ImagePresetsManager
+
+    ImagePresetsManager.loadFactoryPresets()
+    initialNames = [p.name for p in ImagePresetsManager.getPresets()]
+    errors = []
+    done = threading.Event()
+
+    def setValues(preset, value):
+        # Readers check that contrast is always brightness + 100
+        preset.update(dict(brightness=value, contrast=value + 100))
+
+    def singleWriter(index):
+        for i in range(iterations):
+            preset = ImagePreset(name=f"Stress {index}-{i}")
+            ImagePresetsManager.addPreset(preset)
+            setValues(preset, i % 100)
+            preset.name = f"Stress {index}-{i} renamed"
+            ImagePresetsManager.removePreset(preset)
+
+    def batchWriter(index):
+        for i in range(iterations):
+            presets = [
+                ImagePreset(name=f"Stress batch {index}-{i}-{j}")
+                for j in range(batchSize)
+            ]
+            ImagePresetsManager.addPresets(presets)
+            for preset in presets:
+                setValues(preset, (i + 50) % 100)
+            ImagePresetsManager.removePresets(presets)
+
+    def reader():
+        while not done.is_set():
+            presets = ImagePresetsManager.getPresets()
+            names = [p.name for p in presets]
+            if len(set(names)) != len(names):
+                errors.append(f"Duplicate names: {sorted(names)}")
+            for snapshot in ImagePresetsManager.getSnapshots():
+                if snapshot.hash != _snapshotHash(snapshot, ImagePreset._attrs):
+                    errors.append(f"Inconsistent hash: {snapshot!r}")
+                if snapshot.name.startswith("Stress") and round(
+                    snapshot.contrast * 100
+                ) != round(snapshot.brightness * 100) + 100:
+                    errors.append(
+                        f"Torn snapshot: {snapshot!r} brightness "
+                        f"{snapshot.brightness} contrast {snapshot.contrast}"
+                    )
+
+    def run(function, *args):
+        try:
+            function(*args)
+        except Exception as error:
+            errors.append(f"{function.__name__}: {error!r}")
+
+    writerThreads = [
+        threading.Thread(
+            target=run, args=(singleWriter if i % 2 else batchWriter, i)
+        )
+        for i in range(writers)
+    ]
+    readerThreads = [threading.Thread(target=run, args=(reader,)) for _ in range(readers)]
+    for thread in readerThreads + writerThreads:
+        thread.start()
+    for thread in writerThreads:
+        thread.join()
+    done.set()
+    for thread in readerThreads:
+        thread.join()
+
+    names = [p.name for p in ImagePresetsManager.getPresets()]
+    if names != initialNames:
+        errors.append(f"Presets left after the writers: {names}")
+    return errors
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=300)
+    options = parser.parse_args(args)
+
+    replayPresetsController.installStubs()
+    libFolder = replayPresetsController.libFolder
+    sys.path[:0] = [libFolder, os.path.join(libFolder, "imagePresetsLib")]
+    # Switch threads often to interleave writers and readers
+    sys.setswitchinterval(1e-5)
+
+    errors = stress(options.writers, options.readers, options.iterations)
+    for error in errors[:20]:
+        print(error)
+    if errors:
+        print(f"FAILED: {len(errors)} errors")
+        sys.exit(1)
+    print(
+        f"OK: {options.writers} writers, {options.readers} readers, "
+        f"{options.iterations} iterations"
+    )
+
+
+if __name__ == "__main__":
+    main()